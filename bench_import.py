@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+bench_import.py
+
+Benchmark of the import time of vl3 entry points, each import runs
+in a new python process :
+- core : the vl3core package, for scripting use of LidarData
+- app : the vl3_app module, before a window is created
+- gui : the modules needed to create a window (rhi, controller)
+
+usage : bench_import.py [REPEATS]
+"""
+
+import os
+import sys
+import subprocess
+
+
+entry_points = [('core', 'import vl3core'),
+                ('app', 'import vl3_app'),
+                ('gui', 'import vl3_app, rhi, controller')]
+
+_timer = '''
+import time
+start = time.time()
+%s
+print time.time() - start
+'''
+
+
+def import_time(statement):
+    """
+    time in seconds to run an import statement in a new python process, from the vl3 folder
+    None if the import fails
+    """
+
+    folder = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen([sys.executable, '-c', _timer % statement], cwd=folder,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    if process.returncode != 0:
+        return None
+
+    return float(out.split()[-1])
+
+
+def main():
+
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    for name, statement in entry_points:
+        times = [import_time(statement) for i in range(repeats)]
+        if None in times:
+            print '%6s : import failed (%s)' % (name, statement)
+            continue
+        times.sort()
+        print '%6s : best %6.3f s, median %6.3f s (%s)' % (name, times[0], times[len(times) // 2], statement)
+
+
+if __name__ == '__main__':
+    main()
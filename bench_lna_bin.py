@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+bench_lna_bin.py
+
+Benchmark of the noise and range correction of lna binary files.
+Compares the former per-profile correction with the float32 in-place
+correction of lna_binary_file_read. Each pipeline runs in a forked process,
+its memory use beyond the raw file data and the final data arrays
+is reported per profile.
+
+usage : bench_lna_bin.py [LNA_BINARY_FILE]
+"""
+
+import os
+import sys
+import time
+import resource
+import numpy as np
+
+from vl3core.lna_bin import lna_bin_read, lna_binary_file_read, _improve_channel_names
+
+
+testfile = 'test_data/binary/lna_0a_rawNF_v01_20110705_065026_31.dat'
+
+
+def per_profile_file_read(lnafile):
+    """
+    noise and range correction as done before, profile by profile in float64,
+    followed by scaling and altitude cut-off copies
+    """
+
+    time, r, p, b, channels, fov = lna_bin_read(lnafile)
+    nchannels = len(channels)
+
+    pmbr2 = [np.empty_like(p[i], dtype='f4') for i in range(nchannels)]
+    for i in range(nchannels):
+        if p[i].shape[1] < 2:
+            continue
+        nprof = p[i].shape[0]
+        for j in range(nprof):
+            pmb = p[i][j,:] - b[i]
+            pmbr2[i][j,:] = pmb * r * r
+
+    channels = _improve_channel_names(channels, fov)
+    data = {}
+    for j in range(nchannels):
+        if channels[j] is not None:
+            data[channels[j]] = pmbr2[j] * 1e-12
+
+    r /= 1e3
+    idx = (r < 15.)
+    for key in data:
+        data[key] = data[key][:,idx]
+
+    return {'time':time, 'alt':r[idx], 'data':data}
+
+
+def _run(file_read_function, lnafile):
+    """
+    runs file_read_function in a child process
+    returns elapsed time, number of profiles, bytes of memory used beyond the file and output arrays
+    """
+
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        lna_data = file_read_function(lnafile)
+        elapsed = time.time() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        output = sum(d.nbytes for d in lna_data['data'].values())
+        extra = (rss_after - rss_before) * 1024 - output - os.path.getsize(lnafile)
+        os.write(wfd, '%f %d %d' % (elapsed, len(lna_data['time']), extra))
+        os._exit(0)
+
+    os.close(wfd)
+    result = os.read(rfd, 1024)
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    elapsed, nprof, extra = result.split()
+
+    return float(elapsed), int(nprof), int(extra)
+
+
+def main():
+
+    lnafile = sys.argv[1] if len(sys.argv) > 1 else testfile
+
+    print 'file : ', lnafile
+    for name, function in ('per-profile', per_profile_file_read), ('in-place', lna_binary_file_read):
+        elapsed, nprof, extra = _run(function, lnafile)
+        print '%12s : %8.3f s, %6d profiles, %10.1f extra bytes per profile' % (name, elapsed, nprof, max(extra, 0) / float(nprof))
+
+
+if __name__ == '__main__':
+    main()
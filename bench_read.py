@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+bench_read.py
+
+Benchmark of the parallel read of the files of a folder.
+The folder is opened with LidarData and all its channels are read,
+with files read one after another, then by a pool of threads.
+Each read is done once before timing, so that files are in the system cache.
+
+usage : bench_read.py [FOLDER] [WORKERS]
+"""
+
+import sys
+import time
+from multiprocessing import cpu_count
+
+from vl3core import LidarData
+
+
+testfolder = 'test_data/binary'
+
+
+def read_time(folder, workers, repeats=3):
+    """
+    best time in seconds to open folder and read all its channels
+    """
+
+    times = []
+    for i in range(repeats + 1):
+        start = time.time()
+        lidardata = LidarData(folder, workers=workers, cache=False)
+        for name in lidardata.data:
+            lidardata.data[name]
+        times.append(time.time() - start)
+
+    return min(times[1:])
+
+
+def main():
+
+    folder = sys.argv[1] if len(sys.argv) > 1 else testfolder
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else cpu_count()
+
+    print 'folder : ', folder
+    serial = read_time(folder, 1)
+    print '%12s : %8.3f s' % ('1 worker', serial)
+    parallel = read_time(folder, workers)
+    print '%12s : %8.3f s, speed-up %.2f' % ('%d workers' % workers, parallel, serial / parallel)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,10 +6,51 @@ config.py
 Created by Vincent Noel - LMD/CNRS on 2011-11-22.
 """
 
+import os
+
 major_version = 0
 minor_version = 9.1
 basesirta_path = '/bdd/SIRTA/'
 
+# number of files read in parallel in a folder, None uses all cores, 1 reads files one by one
+read_workers = None
+
+# regular time grid of data : step is 'median' or 'mode' of the time differences between profiles,
+# or a number of seconds. profiles further than tolerance seconds from a grid time are missing (None : step)
+regrid_time_step = 'median'
+regrid_time_tolerance = None
+
+# user folder for vl3 files (file indexes of read-only folders...)
+cache_path = os.path.expanduser('~/.vl3')
+# name of the file describing the data files in a folder
+index_sidecar = '.vl3index'
+# maximum size in bytes of the cache of channels read in windows (datasets opened with cache=True,
+# see vl3core.LidarData), 0 disables the cache
+data_cache_size = 20 * 1024**3
+# maximum size in bytes of the display arrays kept by each window, to switch back instantly
+# to channels and scales already shown
+display_cache_size = 2 * 1024**3
+# number of threads computing the display arrays (ratio, range correction, log10)
+display_workers = 4
+# maximum number of profile plot updates per second when moving along the curtain plot
+profile_refresh_rate = 30
+# resolutions offered in windows : (profiles, gates) aggregated in each bin, (1, 1) is the full resolution,
+# and aggregation of bins : 'mean', 'median', 'count' or 'sum'
+binning_resolutions = [(1, 1), (2, 2), (5, 2), (10, 4), (30, 10), (60, 20)]
+binning_statistic = 'mean'
+# seconds between two reads of the files of a folder followed while they are written
+follow_interval = 10
+
+# curtain plots of large datasets show a downsampled level of detail : levels are at least lod_min_size
+# profiles or gates long, and show the 'min', 'mean' or 'max' of the profiles and gates they merge
+lod_min_size = 512
+lod_statistic = 'mean'
+
+# color scales span these percentiles of the displayed values, taken from histograms
+# with histogram_bins_per_decade bins per decade of values (percentiles within 1% for 256)
+color_scale_percentiles = (1, 99)
+histogram_bins_per_decade = 256
+
 
 def main():
     pass
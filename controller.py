@@ -73,8 +73,9 @@ class RhiController(Handler):
         
     def new_view(self, ui_info):
         
-        if self.view.data_source:
-            rhi = Rhi(data_source=self.view.data_source)
+        if self.view.dataset is not None:
+            # the new window shares the dataset of this one
+            rhi = Rhi(lidardata=self.view.dataset)
         else:
             # this should not happen...
             rhi = Rhi()
@@ -107,6 +108,7 @@ class RhiController(Handler):
         # would be nice to close the profile plot
         # but easier said than done
         # tip: info.ui.dispose()
+        self.view.close()
         return Handler.close(self, info, is_ok)
 
 def main():
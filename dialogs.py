@@ -6,9 +6,12 @@ dialogs.py
 Created by Vincent Noel - LMD/CNRS on 2012-02-10.
 """
 
-from traits.api import HasTraits, Float
-from traitsui.api import Item, View
+import numpy as np
+import chaco.api as chaco
+from traits.api import HasTraits, Float, Instance
+from traitsui.api import Item, UItem, View
 from traitsui.menu import OKCancelButtons
+from enable.api import ComponentEditor
 
 
 class _TwoValuesSelectorDialog(HasTraits):
@@ -32,9 +35,50 @@ class AxisRange(_TwoValuesSelectorDialog):
         
 
 class ColorScaleRange(_TwoValuesSelectorDialog):
+    '''
+    shows the histogram of displayed values (see vl3core.display.Histogram) if given,
+    with the selected range.
+    '''
     
     ymin = Float(label='Min value')
     ymax = Float(label='Max value')
+    histogram_plot = Instance(chaco.Plot)
+    view = View(UItem('histogram_plot', width=400, height=250, editor=ComponentEditor(), 
+                      visible_when='histogram_plot is not None'),
+                Item('ymin'), Item('ymax'), buttons=OKCancelButtons, title='Adjust Values')
+    
+    def __init__(self, ymin, ymax, histogram=None):
+        self.ymin = ymin
+        self.ymax = ymax
+        if histogram is not None:
+            self.histogram_plot = self._histogram_create(histogram)
+            
+    def _histogram_create(self, histogram):
+        
+        # the bins of most values, not of outliers
+        values, counts = histogram.bins(histogram.percentile(0.1), histogram.percentile(99.9))
+        self.plotdata = chaco.ArrayPlotData(values=values, counts=counts)
+        self._range_update()
+        plot = chaco.Plot(self.plotdata)
+        plot.plot(('values', 'counts'), type='line', color='blue')
+        plot.plot(('range_values', 'range_counts'), type='line', color='red')
+        plot.index_axis.title = 'Value'
+        plot.value_axis.title = 'Count'
+        return plot
+        
+    def _range_update(self):
+        
+        top = np.max(self.plotdata.get_data('counts'), initial=0)
+        self.plotdata.set_data('range_values', np.array([self.ymin, self.ymin, self.ymax, self.ymax]))
+        self.plotdata.set_data('range_counts', np.array([0, top, top, 0]))
+        
+    def _ymin_changed(self):
+        if self.histogram_plot is not None:
+            self._range_update()
+        
+    def _ymax_changed(self):
+        if self.histogram_plot is not None:
+            self._range_update()
 
 
 def main():
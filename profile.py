@@ -9,18 +9,21 @@ Copyright (c) 2011 LMD/CNRS. All rights reserved.
 
 import chaco.api as chaco
 
-from traits.api import HasTraits, Instance
-from traitsui.api import UItem, View, VGroup, Handler
+from traits.api import HasTraits, Instance, Range
+from traitsui.api import Item, UItem, View, VGroup, Handler
 from enable.api import ComponentEditor
 
 
 class ProfilePlot(HasTraits):
     
     profileplot = Instance(chaco.Plot)
+    # number of profiles averaged in the profile shown
+    mean_profiles = Range(1, 10000, 1)
     
     traits_view = View(
         VGroup(
             UItem('profileplot', width=300, height=500, editor=ComponentEditor()),
+            Item('mean_profiles', label='Mean of profiles'),
         ),
         resizable=True,
         title='Profile',
@@ -53,6 +56,12 @@ class ProfilePlot(HasTraits):
         self.profileplot.title = 'Profile ' + str(profname)
         
         
+    def _mean_profiles_changed(self):
+        
+        if self.parent:
+            self.parent.profile_update()
+        
+        
     def save_image(self, save_image_file):
         
         window_size = self.profileplot.outer_bounds
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+quicklook.py
+
+Headless quicklook renderer : curtain plots of lidar data with their colorbar,
+saved as image files without any GUI toolkit (matplotlib Agg backend).
+Color scale, log scale, range correction and ratios are computed as in vl3 windows.
+Sources are rendered in parallel, one per process.
+
+usage :
+    quicklook.py [options] SOURCE [SOURCE ...]
+    quicklook.py [options] --instrument INSTRUMENT --start DAY --end DAY
+with the second form, one quicklook is rendered for each day of the archive catalog
+(see vl3core.catalog) between the two days.
+"""
+
+import os
+import time
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import matplotlib.dates as mdates
+
+from vl3core import LidarData, InvalidFormat
+from vl3core.catalog import catalog_days
+from vl3core.display import display_transform, ColorStatistics
+from vl3core.util import pool_map
+
+
+def _file_name(text):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in text).strip('_')
+
+
+def _source_name(source):
+    if isinstance(source, tuple):
+        instrument, start, end = source
+        return '%s_%s' % (instrument, start.strftime('%Y%m%d'))
+    return os.path.splitext(os.path.basename(os.path.normpath(source)))[0]
+
+
+def quicklook_render(lidardata, channel, filename, ratio=None, log_scale=False, range_correct=False,
+                     alt_max=None, size=(12, 4), dpi=100):
+    """
+    renders a curtain plot of a channel of lidardata in an image file.
+    if ratio is a channel name, the ratio channel/ratio is shown instead (not in log10, not range-corrected).
+    """
+
+    statistics = ColorStatistics()
+    if ratio is not None:
+        data = display_transform(lidardata.data[channel], denum=lidardata.data[ratio])
+        title = 'Ratio ' + channel + '/' + ratio
+        log_scale = False
+        statistics.update(data)
+    else:
+        data = display_transform(lidardata.data[channel], lidardata.alt, log_scale, range_correct)
+        title = channel
+        statistics.update(lidardata.data[channel], lidardata.alt, range_correct)
+    vmin, vmax = statistics.color_range(log_scale)
+
+    time = mdates.epoch2num(lidardata.epochtime)
+    extent = [time[0], time[-1], lidardata.alt[0], lidardata.alt[-1]]
+
+    figure = Figure(figsize=size, dpi=dpi)
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    img = ax.imshow(np.ma.masked_invalid(data.T), origin='lower', aspect='auto', extent=extent,
+                    cmap='jet', vmin=vmin, vmax=vmax, interpolation='nearest')
+    ax.xaxis_date()
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+    ax.set_ylabel('Range [km]')
+    if alt_max is not None:
+        ax.set_ylim(lidardata.alt[0], alt_max)
+    ax.set_title(str(lidardata.date.date()) + ' : ' + title)
+    colorbar = figure.colorbar(img, ax=ax)
+    colorbar.set_label(channel + ' [Log10]' if log_scale else channel)
+
+    figure.savefig(filename)
+
+
+def quicklook_job(job):
+    """
+    renders the quicklooks of a source, runs in a worker process.
+    job is (source, channels, output folder, options)
+    returns the list of files saved, and an error message or None
+    """
+
+    source, channels, output, options = job
+    try:
+        lidardata = LidarData(from_source=source, workers=1, cache=False)
+    except InvalidFormat as inst:
+        return [], '%s : %s' % (source, inst.args[0])
+
+    available = sorted(lidardata.data.keys())
+    if not channels:
+        channels = available[:1]
+
+    missing = [channel for channel in channels if channel not in available]
+    saved = []
+    for channel in channels:
+        if channel in missing:
+            continue
+        name = channel if options['ratio'] is None else channel + '_over_' + options['ratio']
+        filename = os.path.join(output, _file_name(_source_name(source) + '_' + name) + '.png')
+        quicklook_render(lidardata, channel, filename, **options)
+        saved.append(filename)
+
+    if missing:
+        return saved, '%s : no channel %s. Channels : %s' % (source, ', '.join(missing), available)
+    return saved, None
+
+
+def archive_sources(instrument, start, end):
+    """
+    catalog queries (instrument, start, end) for each day of the archive catalog with data between start and end
+    """
+
+    sources = []
+    for day, nfiles, first, last in catalog_days(instrument):
+        if day is None:
+            continue
+        day = datetime.strptime(day, '%Y-%m-%d')
+        if start <= day <= end:
+            sources.append((instrument, day, day + timedelta(days=1) - timedelta(seconds=1)))
+
+    return sources
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Renders quicklook images of lidar data.')
+    parser.add_argument('sources', nargs='*', help='data files or folders')
+    parser.add_argument('--instrument', help='instrument (data format) in the archive catalog')
+    parser.add_argument('--start', help='first day in the archive catalog (YYYY-MM-DD)')
+    parser.add_argument('--end', help='last day in the archive catalog (YYYY-MM-DD), default : start')
+    parser.add_argument('-c', '--channel', action='append', default=[],
+                        help='channel to render (can be repeated), default : the first channel')
+    parser.add_argument('--ratio', help='render channel / RATIO')
+    parser.add_argument('--log', action='store_true', help='log10 scale')
+    parser.add_argument('--range-correct', action='store_true', help='range-correct data')
+    parser.add_argument('--alt-max', type=float, help='maximum altitude shown [km]')
+    parser.add_argument('-o', '--output', default='.', help='output folder')
+    parser.add_argument('-j', '--workers', type=int, help='number of processes, default : number of cores')
+    args = parser.parse_args()
+
+    np.seterr(all='ignore')
+
+    sources = list(args.sources)
+    if args.instrument:
+        if not args.start:
+            parser.error('--instrument needs --start')
+        start = datetime.strptime(args.start, '%Y-%m-%d')
+        end = datetime.strptime(args.end, '%Y-%m-%d') if args.end else start
+        sources.extend(archive_sources(args.instrument, start, end))
+    if not sources:
+        parser.error('no source to render')
+
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+
+    options = {'ratio':args.ratio, 'log_scale':args.log, 'range_correct':args.range_correct, 'alt_max':args.alt_max}
+    jobs = [(source, args.channel, args.output, options) for source in sources]
+
+    start_time = time.time()
+    results = pool_map(quicklook_job, jobs, workers=args.workers, processes=True)
+    elapsed = time.time() - start_time
+
+    nimages = 0
+    for saved, error in results:
+        nimages += len(saved)
+        if error is not None:
+            print 'Error : ', error
+    print '%d sources, %d images in %.1f s (%.1f sources per minute)' % (len(sources), nimages, elapsed, len(sources) * 60. / elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,7 @@ but menu items most likely won't work.
 
 import sys
 import os
+import copy
 import numpy as np
 import chaco.api as chaco
 from chaco.tools.api import LineInspector, ZoomTool, PanTool
@@ -35,21 +36,30 @@ from traitsui.api import Item, UItem, View, HGroup, VGroup, Label
 from traitsui.menu import Menu, MenuBar, CloseAction, Action, Separator
 from enable.api import ComponentEditor
 
-from pyface.api import MessageDialog, ImageResource
+from pyface.api import MessageDialog, ImageResource, ProgressDialog, GUI
+from pyface.timer.api import do_after, Timer
+from threading import Thread
 
-from lidardata import LidarData, InvalidFormat
+from vl3core.lidardata import LidarData, InvalidFormat, source_cached, source_cache_key
+from vl3core.lna_bin import LnaBinaryFollower
+from vl3core.registry import dataset_open, dataset_opened, dataset_register, dataset_shared, dataset_acquire, dataset_release
 from profile import ProfilePlot, ProfileController
 
 from config import minor_version, major_version
-from config import basesirta_path
+from config import basesirta_path, lod_statistic, display_cache_size, display_workers, profile_refresh_rate
+from config import binning_resolutions, binning_statistic, follow_interval
 
 from dialogs import AxisRange, ColorScaleRange
-from util import signal_ratio
+from vl3core.util import epoch_to_datetime64, LruCache
+from vl3core.display import display_transform, ColorStatistics, LodPyramid, ProfileMeans
 
 
 # change factor for colormap caxis
 cmap_change_factor = 1.5
 
+# names of the resolutions shown in the resolution selector
+resolution_names = ['Full' if bins == (1, 1) else '%d x %d' % bins for bins in binning_resolutions]
+
 menubar = MenuBar(
     Menu(
         CloseAction,
@@ -77,6 +87,17 @@ menubar = MenuBar(
 )
 
 
+def statistics_update(statistics, data, alt, range_correct=False, denum=None, weight=1):
+    '''
+    adds profiles of a channel to its color statistics, or their ratio to denum profiles.
+    weight -1 removes them.
+    '''
+    
+    if denum is not None:
+        data = display_transform(data, denum=denum, workers=display_workers)
+    statistics.update(data, alt, range_correct, weight=weight)
+    
+
 def add_date_axis(plot):
     
     bottom_axis = chaco.PlotAxis(plot, orientation='bottom', tick_generator=ScalesTickGenerator(scale=CalendarScaleSystem()))
@@ -88,7 +109,33 @@ class Rhi(HasTraits):
     
     data_list = List([])
     data_source = None
+    # dataset opened, shared with other windows (see vl3core.registry)
+    dataset = None
+    # dataset shown : the opened dataset, binned at the selected resolution
+    lidardata = None
     profileplot = None
+    # levels of detail of the displayed array, and level shown
+    lod = None
+    lod_level = None
+    # color statistics of channels, by (channel, denominator channel, range correction)
+    color_statistics = None
+    # levels of detail of the display arrays already shown, 
+    # by (channel, denominator channel, data type, log scale, range correction)
+    display_cache = None
+    # running means of profiles of the displayed array
+    profile_means = None
+    # profile selected in the curtain plot, shown at the next profile refresh
+    _profile_index = 0
+    _profile_refresh = False
+    # identifies the current opening of a folder in the background, and its cache key
+    _load_id = 0
+    _cache_key = None
+    # identifies the current read of the displayed array in the background, and its progress dialog
+    _display_id = 0
+    progress = None
+    # files of the folder followed while they are written, and the timer polling them
+    follower = None
+    follow_timer = None
     plot_title = Str('')
     window_title = Str('View Lidar 3 v%d.%d' % (major_version, minor_version))
     
@@ -101,8 +148,12 @@ class Rhi(HasTraits):
     container = Instance(chaco.HPlotContainer)
     show_profile = Button('Show profile')
     log_scale = Bool
+    # bins of profiles x gates, see config.binning_resolutions
+    resolution = Enum(resolution_names)
     range_correct = Bool
+    follow = Bool
     reset_zoom = Button('Reset Zoom')
+    load_zoom = Button('Load Zoom')
     scale_more = Button('Scale++')
     scale_less = Button('Scale--')
     adjust_axis = Button('Adjust Axis')
@@ -139,10 +190,13 @@ class Rhi(HasTraits):
                 UItem('show_profile'),
                 UItem('adjust_axis'),
                 UItem('reset_zoom'),
+                UItem('load_zoom'),
                 UItem('scale_less'),
                 UItem('scale_more'),
                 Item('log_scale', label='Log Scale', visible_when='"Signal" in data_type'),
-                Item('range_correct', label='range-correct data', visible_when='"binary" in filetype and data_type!="Ratio"')
+                Item('range_correct', label='range-correct data', visible_when='"binary" in filetype and data_type!="Ratio"'),
+                Item('resolution', label='Bins (profiles x gates)'),
+                Item('follow', label='Follow', visible_when='"binary" in filetype')
             ),
             visible_when='plot_title != ""'
         ),
@@ -153,15 +207,25 @@ class Rhi(HasTraits):
     )
     
     
-    def __init__(self, data_source=None, base_folder=basesirta_path):
+    def __init__(self, data_source=None, base_folder=basesirta_path, lidardata=None):
+        '''
+        shows data_source, or lidardata if given (a dataset shown in another window)
+        '''
                 
         self.pcolor_data = chaco.ArrayPlotData()
         self.pcolor_data.set_data('image', np.zeros([1,1]))
         self.pcolor, self.container, self.colorbar = self.pcolor_create(self.pcolor_data)
+        # show the level of detail matching the visible area
+        self.pcolor.index_range.on_trait_change(self.update_lod, 'updated')
+        self.pcolor.value_range.on_trait_change(self.update_lod, 'updated')
+        self.img.on_trait_change(self.update_lod, 'bounds')
 
         self.save_image_file = os.getcwd() + '/figure.png'
         self.save_profile_file = os.getcwd() + '/profile.png'
 
+        if lidardata is not None:
+            data_source = lidardata.data_source
+
         if data_source is None:
             if os.path.isdir(base_folder):
                 self.directory_to_load = base_folder
@@ -173,7 +237,12 @@ class Rhi(HasTraits):
             else:
                 self.directory_to_load = os.path.dirname(data_source)
             
-            self.open_data(data_source)
+            if lidardata is None:
+                self.open_data(data_source)
+            else:
+                # a dataset followed in the other window grows : its profiles so far are shown
+                self.dataset_set(dataset_acquire(lidardata) if dataset_shared(lidardata) else lidardata.copy())
+                self.data_opened(data_source)
                 
 
     def _adjust_axis_fired(self):
@@ -193,7 +262,8 @@ class Rhi(HasTraits):
     def _adjust_color_scale_fired(self):
         
         crange = [self.img.color_mapper.range.low, self.img.color_mapper.range.high]
-        colorscale = ColorScaleRange(*crange)
+        histogram = self.channel_statistics().histogram(self.log_scale)
+        colorscale = ColorScaleRange(*crange, histogram=histogram)
         colorscale.configure_traits(kind='modal')
         ymin, ymax = colorscale.range()
         self.img.color_mapper.range.set_bounds(ymin, ymax)
@@ -212,14 +282,110 @@ class Rhi(HasTraits):
         if data_source is None:
             return
             
+        # folders are opened file by file, unless they are in the data cache
+        if os.path.isdir(data_source) and not source_cached(data_source) and not dataset_opened(data_source):
+            self.open_data_progressive(data_source)
+            return
+            
+        # stop loading files from another source
+        self._load_id += 1
+        self._cache_key = None
+            
         try:
-            self.lidardata = LidarData(from_source=data_source)
+            self.dataset_set(dataset_open(data_source))
         except InvalidFormat as inst:
-            msg = MessageDialog(message=inst.args[0], severity='warning', title='Problem')
-            msg.open()
+            self.invalid_format_message(inst.args[0])
+            return
+            
+        self.data_opened(data_source)
+        
+        
+    def open_data_window(self, time_range, alt_range):
+        '''
+        reads again the current data source, only in time_range and alt_range.
+        the displayed channel is kept.
+        '''
+        
+        self._load_id += 1
+        self._cache_key = None
+        seldata = self.seldata
+        
+        try:
+            self.dataset_set(dataset_open(self.data_source, time_range, alt_range))
+        except InvalidFormat as inst:
+            self.invalid_format_message(inst.args[0])
+            return
+            
+        self.data_opened(self.data_source)
+        if seldata in self.data_list:
+            self.seldata = seldata
+        
+        
+    def dataset_set(self, lidardata):
+        '''
+        shows lidardata instead of the current dataset, which is released.
+        '''
+        
+        if self.dataset is not None:
+            dataset_release(self.dataset)
+        self.dataset = lidardata
+        self.lidardata = lidardata
+        
+        
+    def close(self):
+        '''
+        stops following, loading and reading the data shown, and releases the dataset.
+        callbacks of loading and reading threads still to come are ignored.
+        '''
+        
+        self.follow = False
+        self._load_id += 1
+        self._display_id += 1
+        self._cache_key = None
+        self.progress_close()
+        self.dataset_set(None)
+        
+        
+    def resolution_apply(self):
+        '''
+        shows the dataset binned at the selected resolution
+        '''
+        
+        nprofs, ngates = binning_resolutions[resolution_names.index(self.resolution)]
+        if (nprofs, ngates) == (1, 1):
+            self.lidardata = self.dataset
+        else:
+            self.lidardata = self.dataset.binned(nprofs, ngates, binning_statistic)
+            
+            
+    def _resolution_changed(self):
+        
+        # nothing to bin before the first file of a folder is loaded
+        if self.dataset is None or not hasattr(self.dataset, 'data'):
             return
             
+        self.resolution_apply()
+        self.color_statistics = dict()
+        self.display_cache.clear()
+        self._seldata_changed()
+        
+        
+    def invalid_format_message(self, message):
+        
+        msg = MessageDialog(message=message, severity='warning', title='Problem')
+        msg.open()
+        
+        
+    def data_opened(self, data_source):
+        '''
+        shows data after lidardata has been opened from data_source
+        '''
+            
+        self.follow = False
         self.data_source = data_source
+        self.resolution_apply()
+        self.color_statistics = dict()
+        self.display_cache = LruCache(display_cache_size)
                 
         self.data_type = 'Signal'
         
@@ -232,7 +398,64 @@ class Rhi(HasTraits):
         self.seldata = self.data_list[0]
         self.directory_to_load = data_source
 
-        self.pcolor_set_data(self.lidardata.data[self.seldata].T)
+        self._seldata_changed()
+        
+        
+    def open_data_progressive(self, data_source):
+        '''
+        opens a folder in a background thread : files are opened without being read.
+        the displayed channel is then read file by file, and shown as it is read (see display_load).
+        '''
+        
+        self._load_id += 1
+        # files written while loading are not in the cached dataset
+        self._cache_key = source_cache_key(data_source)
+        self.progress = ProgressDialog(title='Opening data', message=data_source, max=100, 
+                                        show_time=True, can_cancel=True)
+        self.progress.open()
+        
+        thread = Thread(target=self._dataset_read, args=(self._load_id, data_source))
+        thread.daemon = True
+        thread.start()
+        
+        
+    def _dataset_read(self, load_id, data_source):
+        '''
+        runs in the loading thread : opens the files of data_source, and hands the dataset to the UI thread
+        '''
+        
+        try:
+            lidardata = LidarData(data_source, cache=False)
+        except InvalidFormat as inst:
+            GUI.invoke_later(self._dataset_failed, load_id, inst.args[0])
+            return
+        GUI.invoke_later(self._dataset_opened, load_id, lidardata)
+        
+        
+    def _dataset_failed(self, load_id, message):
+        
+        if load_id != self._load_id:
+            return
+        self.progress_close()
+        self.invalid_format_message(message)
+        
+        
+    def _dataset_opened(self, load_id, lidardata):
+        
+        if load_id != self._load_id:
+            return
+        self.dataset_set(lidardata)
+        # other windows opening this folder can now share the dataset
+        dataset_register(lidardata)
+        self.data_opened(lidardata.data_source)
+        
+        
+    def progress_close(self):
+        
+        if self.progress is not None and self.progress.control is not None:
+            self.progress.close()
+        self.progress = None
+        
         
     def update_data_list(self, data_type):
         
@@ -269,26 +492,51 @@ class Rhi(HasTraits):
         http://markmail.org/message/r5m2dmkff3kvotek#query:+page:1+mid:zf6u7xtntjvsdpnq+state:results
         '''
         
-        datasource = self.pcolor.range2d.sources[0]
-        datasource.set_data(self.lidardata.epochtime, self.lidardata.alt)
-        
         self.img.x_mapper.domain_limits = (self.lidardata.epochtime[0], self.lidardata.epochtime[-1])
         self.img.y_mapper.domain_limits = (self.lidardata.alt[0], self.lidardata.alt[-1])
 
 
-    def set_color_scale(self, data_to_show):
+    def statistics_key(self):
+        '''
+        identifies the color statistics of the displayed channel
+        '''
+        
+        if self.data_type == 'Ratio':
+            return (self.seldata, self.denum_seldata, False)
+        return (self.seldata, None, self.range_correct)
+        
+        
+    def channel_statistics(self):
+        '''
+        color statistics of the displayed channel, computed once per channel.
+        '''
+        
+        key = self.statistics_key()
+        if key not in self.color_statistics:
+            statistics = ColorStatistics()
+            self._statistics_update(key, statistics, 0)
+            self.color_statistics[key] = statistics
+            
+        return self.color_statistics[key]
+        
+        
+    def _statistics_update(self, key, statistics, start, weight=1):
         '''
-        sets the range for the plot color scale, using the min and max value of the displayed data array.
+        adds profiles from start of the channel identified by key to its color statistics,
+        or removes them with weight -1
         '''
+        
+        channel, denum_channel, range_correct = key
+        denum = self.lidardata.rows(denum_channel, start) if denum_channel is not None else None
+        statistics_update(statistics, self.lidardata.rows(channel, start), self.lidardata.alt, range_correct, denum, weight)
+        
 
-        min = np.nanmin(data_to_show)
-        max = np.nanmax(data_to_show)
-        range = max - min
+    def set_color_scale(self):
+        '''
+        sets the range for the plot color scale, using percentiles of the displayed channel values.
+        '''
 
-        if not self.log_scale:
-            datarange = [min, max - range*0.25]
-        else:
-            datarange = [min + range*0.25, max]
+        datarange = self.channel_statistics().color_range(self.log_scale)
 
         self.img.color_mapper.range.set_bounds(datarange[0], datarange[1])
         self.colorbar.index_mapper.domain_limits = (datarange[0], datarange[1])
@@ -296,18 +544,50 @@ class Rhi(HasTraits):
         self.cmin, self.cmax = self.img.color_mapper.range.low, self.img.color_mapper.range.high
 
 
-    def pcolor_set_data(self, array_data):
+    def pcolor_set_data(self, lod, start=None):
         '''
-        sets the data displayed in the plot.
+        sets the data displayed in the plot, from its levels of detail (see LodPyramid).
+        start is the first profile that changed if lod is the array shown, with profiles added or replaced.
         fixes the color scale and plot ranges accordingly.
         updates the plot title accordingly.
         '''
         
-        self.pcolor_data.set_data('image', array_data)
-        self.set_color_scale(array_data)
+        if start is not None and self.profile_means is not None:
+            self.profile_means.update(lod.level(0)[0], start)
+        else:
+            self.profile_means = None
+        self.lod = lod
+        self.lod_level = None
+        self.update_lod()
+        self.set_color_scale()
         self.set_plot_boundaries()
         
         self.update_titles()
+        if self.profileplot is not None:
+            self.profile_update()
+        
+        
+    def update_lod(self):
+        '''
+        shows the level of detail of the data with about one profile per pixel column
+        and one gate per pixel row in the visible area (full resolution when zoomed in).
+        '''
+        
+        if self.lod is None:
+            return
+            
+        width, height = self.img.bounds
+        time_range = (self.pcolor.index_range.low, self.pcolor.index_range.high)
+        alt_range = (self.pcolor.value_range.low, self.pcolor.value_range.high)
+        level = self.lod.level_for(time_range, alt_range, width, height)
+        if level == self.lod_level:
+            return
+            
+        self.lod_level = level
+        array_data, time, alt = self.lod.level(level, lod_statistic)
+        self.pcolor_data.set_data('image', array_data.T)
+        datasource = self.pcolor.range2d.sources[0]
+        datasource.set_data(time, alt)
         
         
     def pcolor_create(self, pcolor_data):
@@ -386,48 +666,211 @@ class Rhi(HasTraits):
             
         if self.data_type is 'Ratio':
             print 'Data is ratio ', self.seldata, '/', self.denum_seldata
-            data_to_show = signal_ratio(self.lidardata.data[self.denum_seldata], self.lidardata.data[self.seldata]).T
             self.log_scale = False
             self.range_correct = False
+            
+        key = self.display_key()
+        lod = self.display_cache.get(key)
+        if lod is None:
+            self.display_load(key)
+            return
+            
+        # stop reading another array
+        self._display_id += 1
+        self.progress_close()
+        self.pcolor_set_data(lod)
+        
+        
+    def display_load(self, key):
+        '''
+        reads and transforms the displayed array identified by key (see display_key)
+        in a background thread, block by block (see LidarData.row_blocks).
+        each block is added to the plot when it is ready, the previous array is shown until then.
+        '''
+        
+        self._display_id += 1
+        channel, denum_channel, data_type, log_scale, range_correct = key
+        # color statistics are computed with the array, unless they are known already
+        statistics_key = self.statistics_key()
+        statistics = ColorStatistics() if statistics_key not in self.color_statistics else None
+        
+        thread = Thread(target=self._display_read, args=(self._display_id, self.lidardata, key, 
+                                                         self.lidardata.row_blocks(channel), statistics))
+        thread.daemon = True
+        thread.start()
+        
+        
+    def _display_read(self, display_id, lidardata, key, blocks, statistics):
+        '''
+        runs in the display thread : reads blocks of profiles of the displayed array, 
+        and hands their display rows to the UI thread
+        '''
+        
+        channel, denum_channel, data_type, log_scale, range_correct = key
+        for start, end in blocks:
+            if display_id != self._display_id:
+                return
+            data = lidardata.rows(channel, start, end)
+            denum = lidardata.rows(denum_channel, start, end) if denum_channel is not None else None
+            if statistics is not None:
+                statistics_update(statistics, data, lidardata.alt, range_correct, denum)
+            rows = display_transform(data, lidardata.alt, log_scale, range_correct, denum, workers=display_workers)
+            GUI.invoke_later(self._rows_loaded, display_id, key, rows, start, end, copy.deepcopy(statistics))
+            
+            
+    def _rows_loaded(self, display_id, key, rows, start, end, statistics):
+        '''
+        adds profiles start to end of the displayed array to the plot
+        '''
+        
+        if display_id != self._display_id:
+            return
+            
+        if statistics is not None:
+            self.color_statistics[self.statistics_key()] = statistics
+        time = self.lidardata.epochtime[start:end]
+        if start == 0:
+            lod = LodPyramid(rows, time, self.lidardata.alt)
         else:
-            data_to_show = self.lidardata.data[self.seldata].T.copy()
+            lod = self.lod
+            lod.append(rows, time)
+            
+        nprof = len(self.lidardata.epochtime)
+        if end == nprof:
+            self.display_cache.put(key, lod, lod.nbytes)
+        self.pcolor_set_data(lod, None if start == 0 else start)
+        
+        if self.progress is not None:
+            cont, skip = self.progress.update(100 * end // nprof)
+            if not cont:
+                # reading cancelled, keep what is shown
+                self._display_id += 1
+            if end == nprof or not cont:
+                self.progress_close()
+                
+        if end == nprof:
+            # channels read are kept in the data cache (key of a folder opened in the background, 
+            # or the dataset's own, see LidarData.cache_save)
+            self.dataset.cache_save([channel for channel in key[:2] if channel is not None], self._cache_key)
+            
+            
+    def display_key(self):
+        '''
+        identifies the displayed array in the display cache
+        '''
         
-        if self.range_correct:
-            r2 = np.power(self.lidardata.alt, 2)
-            for i in np.r_[0:data_to_show.shape[1]]:
-                data_to_show[:,i] = data_to_show[:,i] * r2
+        if self.data_type is 'Ratio':
+            return (self.seldata, self.denum_seldata, 'Ratio', False, False)
+        return (self.seldata, None, 'Signal', self.log_scale, self.range_correct)
         
-        if self.log_scale:
-            # to avoid error message when doing log10(x<0)
-            idx_pos = data_to_show > 0
-            idx_neg = data_to_show <= 0
-            data_to_show[idx_pos] = np.log10(data_to_show[idx_pos])
-            data_to_show[idx_neg] = np.nan
-                        
-        self.pcolor_set_data(data_to_show)
         
+    def _display_rows(self, start=0):
+        '''
+        displayed array, from profile start
+        '''
         
-    def _profile_data(self, iprof):
-
-        profile_data = self.lidardata.data[self.seldata][iprof,:].copy()
-
-        if self.range_correct:
-            r2 = np.power(self.lidardata.alt, 2)
-            profile_data *= r2            
+        denum = self.lidardata.rows(self.denum_seldata, start) if self.data_type is 'Ratio' else None
+        return display_transform(self.lidardata.rows(self.seldata, start), self.lidardata.alt, 
+                                 self.log_scale, self.range_correct, denum, workers=display_workers)
+                                 
+                                 
+    def _follow_changed(self):
+        '''
+        starts or stops following the files of the folder shown while they are written
+        '''
+        
+        if self.follow_timer is not None:
+            self.follow_timer.Stop()
+            self.follow_timer = None
+            self.follower = None
             
-        if self.log_scale:
-            # little dance to avoid warnings for log10(x<0)
-            idx_pos = profile_data > 0
-            idx_neg = profile_data <= 0
-            profile_data[idx_pos] = np.log10(profile_data[idx_pos])
-            profile_data[idx_neg] = np.nan
-
-        return profile_data
+        if not self.follow:
+            return
+        if self.dataset is None or not os.path.isdir(self.data_source):
+            self.follow = False
+            return
+            
+        # the dataset grows, it is not the one in the data cache anymore
+        self._cache_key = None
+        # profiles of a field of view written later than the other one are read again
+        alt_range = self.dataset.read_options[1]
+        if dataset_shared(self.dataset):
+            # profiles are added to a dataset of this window only, other windows keep theirs
+            self.dataset_set(self.dataset.copy())
+            self.resolution_apply()
+        self.follower = LnaBinaryFollower(self.data_source, alt_range, after=self.dataset.last_time())
+        self.follow_timer = Timer(follow_interval * 1000, self._follow_poll)
+        
+        
+    def _follow_poll(self):
+        '''
+        adds the profiles written since the last poll to the dataset and to the plot.
+        only the profiles that change are transformed for display, binned, and replaced
+        in the color statistics and levels of detail : the new profiles, and the ones after 
+        the last profile with data in every channel, which new profiles can fill 
+        (see LidarData.extend), with the bins they are in.
+        '''
+        
+        if self.follower is None or self.dataset is None:
+            return
+        data = self.follower.read()
+        if data is None:
+            return
+            
+        # first profile shown that can change
+        nprofs = binning_resolutions[resolution_names.index(self.resolution)][0]
+        last_time = self.dataset.last_time()
+        start = 0 if last_time is None else (np.searchsorted(self.dataset.datetime, last_time) + 1) // nprofs
+        
+        reading = self.display_key() not in self.display_cache
+        if reading:
+            # statistics of the array being read only have some of its profiles
+            self.color_statistics.pop(self.statistics_key(), None)
+        for key, statistics in self.color_statistics.items():
+            self._statistics_update(key, statistics, start, weight=-1)
+            
+        if self.dataset.extend(data) == 0 and not self.dataset.filled:
+            # nothing changed, profiles removed are added back
+            for key, statistics in self.color_statistics.items():
+                self._statistics_update(key, statistics, start)
+            return
+        if sorted(self.dataset.data.keys()) != self.data_list:
+            self.update_data_list(self.data_type)
+        if self.lidardata is not self.dataset:
+            # bins are computed when accessed
+            self.resolution_apply()
+            
+        for key, statistics in self.color_statistics.items():
+            self._statistics_update(key, statistics, start)
+        if reading:
+            # it is read again, with the new profiles
+            self.display_cache.clear()
+            self._seldata_changed()
+            return
+        self.lod.append(self._display_rows(start), self.lidardata.epochtime[start:], start=start)
+        self.display_cache.clear()
+        self.display_cache.put(self.display_key(), self.lod, self.lod.nbytes)
+        self.pcolor_set_data(self.lod, start)
+        
+        
+    def _profile_data(self, iprof, nprofs=1):
+        '''
+        profile iprof of the displayed array, or the mean of nprofs profiles centered on it
+        '''
+        
+        data_shown = self.lod.level(0)[0]
+        if nprofs <= 1:
+            return data_shown[iprof]
+            
+        if self.profile_means is None:
+            self.profile_means = ProfileMeans(data_shown)
+        return self.profile_means.mean(iprof, nprofs)
         
         
     def _show_profile_fired(self):
         
         if self.profileplot is None:
+            self._profile_index = 0
             profile_data = self._profile_data(0)
             self.profileplot = ProfilePlot(self, profiledata=profile_data, alt=self.lidardata.alt, profname=0)
             self.profilecontroller = ProfileController(view=self.profileplot)
@@ -440,12 +883,38 @@ class Rhi(HasTraits):
         
         
     def _metadata_changed(self, old, new):
+        '''
+        keeps the profile selected by the line inspector. 
+        the profile plot is updated at most profile_refresh_rate times per second.
+        '''
+        
         if self.img.index.metadata.has_key('selections'):
-            if self.profileplot is not None:
+            if self.profileplot is not None and self.lidardata is not None:
                 iprof = self.img.index.metadata['selections'][0]
                 if iprof is not None:
-                    profile_data = self._profile_data(iprof)
-                    self.profileplot.set_profile(profile_data, self.lidardata.alt, str(self.lidardata.datetime[iprof]))
+                    self._profile_index = self.lod.profile_index(self.lod_level, iprof)
+                    if not self._profile_refresh:
+                        self._profile_refresh = True
+                        do_after(1000 // profile_refresh_rate, self.profile_update)
+                        
+                        
+    def profile_update(self):
+        '''
+        shows the selected profile in the profile plot
+        '''
+        
+        self._profile_refresh = False
+        # the window can be closed since the update was requested
+        if self.profileplot is None or self.lidardata is None:
+            return
+            
+        # profiles shown so far, while the displayed array is read
+        iprof = min(self._profile_index, len(self.lod.time) - 1)
+        nprofs = self.profileplot.mean_profiles
+        profname = str(self.lidardata.datetime[iprof])
+        if nprofs > 1:
+            profname += ' (mean of %d)' % nprofs
+        self.profileplot.set_profile(self._profile_data(iprof, nprofs), self.lidardata.alt, profname)
 
 
     def _reset_scale_fired(self):
@@ -459,6 +928,16 @@ class Rhi(HasTraits):
         self.pcolor.value_range.set_bounds(*self.lidardata.alt_range)
     
     
+    def _load_zoom_fired(self):
+        
+        if self.data_source is None:
+            return
+            
+        time_range = epoch_to_datetime64([self.pcolor.index_range.low, self.pcolor.index_range.high])
+        alt_range = (self.pcolor.value_range.low, self.pcolor.value_range.high)
+        self.open_data_window(tuple(time_range), alt_range)
+        
+        
     def _scale_more_fired(self):
         if self.log_scale:
             self.cmin /= cmap_change_factor
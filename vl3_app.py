@@ -15,12 +15,23 @@ Takes care of creating menus and stuff.
 import numpy as np
 import os, sys
 
-from rhi import Rhi
-from controller import RhiController
-
-from util import print_supported_formats
+from vl3core import print_supported_formats
 from config import major_version, minor_version
 
+
+def open_window(datafile=None):
+    '''
+    opens the main window, showing datafile if given.
+    the GUI modules (and the Enthought Tool Suite) are only imported here.
+    '''
+    
+    from rhi import Rhi
+    from controller import RhiController
+    
+    rhi = Rhi(datafile)
+    controller = RhiController(view=rhi)
+    rhi.configure_traits(handler=controller)
+
     
 if __name__ == '__main__':
     
@@ -37,6 +48,4 @@ if __name__ == '__main__':
     if len(sys.argv) > 1:
         datafile = sys.argv[1]
     
-    rhi = Rhi(datafile)
-    controller = RhiController(view=rhi)
-    rhi.configure_traits(handler=controller)
+    open_window(datafile)
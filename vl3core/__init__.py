@@ -0,0 +1,16 @@
+"""
+vl3core
+
+Reading and processing of lidar data for vl3, without any GUI :
+data files (lna binary, netcdf) are read with lidardata.LidarData,
+which only needs numpy and scipy.
+
+    from vl3core import LidarData
+    lidardata = LidarData('/bdd/SIRTA/...')
+
+The vl3 application (rhi, controller...) is built on top of this package.
+"""
+
+from lidardata import LidarData, InvalidFormat, InvalidFolder, InvalidFile, supported_formats
+from lidardata import source_files, source_index, file_read, catalog_update
+from formats import print_supported_formats
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+catalog.py
+
+Catalog of the data files of an archive tree (see config.basesirta_path) :
+instrument (data format), day and time span of each file, kept in a sqlite
+database in the user folder.
+
+A rescan only lists the folders whose modification time changed, and only
+describes the files that are new or whose size or modification time changed
+(descriptions come from the file index, see fileindex). Files already in the
+catalog are checked in every folder : appending to a file, like lna files
+written all day, does not change the modification time of its folder.
+
+usage : python -m vl3core.catalog [ARCHIVE_FOLDER]
+"""
+
+import os
+import sqlite3
+import unittest
+import numpy as np
+
+from config import cache_path, basesirta_path
+from fileindex import files_index
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+catalog_file = os.path.join(cache_path, 'catalog.sqlite')
+time_format = '%Y-%m-%d %H:%M:%S'
+
+_schema = '''
+create table if not exists folders (path text primary key, parent text, mtime real);
+create table if not exists files (path text primary key, folder text, instrument text, day text,
+                                  start text, end text, size integer, mtime real);
+create index if not exists folders_parent on folders (parent);
+create index if not exists files_folder on files (folder);
+create index if not exists files_instrument_start on files (instrument, start);
+'''
+
+
+def catalog_connect(filename=catalog_file):
+    """
+    opens the catalog database, created if needed
+    """
+
+    folder = os.path.dirname(filename)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    db = sqlite3.connect(filename)
+    db.executescript(_schema)
+
+    return db
+
+
+def _list_folder(folder):
+    """
+    lists a folder : returns the paths of its subfolders,
+    and a dictionary of its files {path : (size, mtime)}
+    """
+
+    subfolders, files = [], dict()
+    if scandir is not None:
+        for entry in scandir(folder):
+            if entry.is_dir():
+                subfolders.append(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                files[entry.path] = (stat.st_size, stat.st_mtime)
+    else:
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if os.path.isdir(path):
+                subfolders.append(path)
+            elif os.path.isfile(path):
+                stat = os.stat(path)
+                files[path] = (stat.st_size, stat.st_mtime)
+
+    return subfolders, files
+
+
+def _stat_files(paths):
+    """
+    dictionary {path : (size, mtime)} of the files in paths that still exist
+    """
+
+    files = dict()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files[path] = (stat.st_size, stat.st_mtime)
+
+    return files
+
+
+def _time_text(t):
+
+    if t is None:
+        return None
+    return np.datetime64(t, 's').tolist().strftime(time_format)
+
+
+def _folder_update(db, folder, files, file_format, file_index_function):
+    """
+    updates the catalog entries of the files of a folder {path : (size, mtime)}
+    returns the number of files described again
+    """
+
+    known = dict((path, (size, mtime)) for path, size, mtime in
+                 db.execute('select path, size, mtime from files where folder = ?', (folder,)))
+
+    removed = [(path,) for path in known if path not in files]
+    db.executemany('delete from files where path = ?', removed)
+
+    formats = dict()
+    for path in files:
+        if known.get(path) == files[path]:
+            continue
+        format = file_format(path)
+        if format is not None:
+            formats.setdefault(format, []).append(path)
+
+    rows = []
+    for format in formats:
+        index = files_index(formats[format], file_index_function(format), format)
+        for path in formats[format]:
+            entry = index[path]
+            size, mtime = files[path]
+            day = entry['start'].date().isoformat() if entry['start'] is not None else None
+            rows.append((path, folder, format, day, _time_text(entry['start']), _time_text(entry['end']), size, mtime))
+    db.executemany('insert or replace into files values (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    return len(rows)
+
+
+def catalog_scan(root, file_format, file_index_function, full=False, filename=catalog_file):
+    """
+    walks the archive tree from root and updates the catalog.
+    file_format(path) is the data format of a file (None if it is not a data file),
+    file_index_function(format) describes a file of that format (see fileindex).
+    folders that did not change since the last scan are not listed again, unless full is True.
+    returns the number of folders listed and of files described
+    """
+
+    root = os.path.abspath(root)
+    db = catalog_connect(filename)
+    known = dict((path, mtime) for path, mtime in db.execute('select path, mtime from folders'))
+
+    seen = set()
+    nfolders, nfiles = 0, 0
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            mtime = os.stat(folder).st_mtime
+        except OSError:
+            continue
+        seen.add(folder)
+
+        if not full and known.get(folder) == mtime:
+            # no file was added or removed, subfolders are known. files can have been appended to
+            stack.extend(path for path, in db.execute('select path from folders where parent = ?', (folder,)))
+            files = _stat_files([path for path, in db.execute('select path from files where folder = ?', (folder,))])
+            described = _folder_update(db, folder, files, file_format, file_index_function)
+            if described > 0:
+                nfiles += described
+                db.execute('update folders set mtime = ? where path = ?', (os.stat(folder).st_mtime, folder))
+            continue
+
+        try:
+            subfolders, files = _list_folder(folder)
+        except OSError as inst:
+            print 'Could not list folder : ', inst
+            continue
+        stack.extend(subfolders)
+        nfolders += 1
+        nfiles += _folder_update(db, folder, files, file_format, file_index_function)
+        # describing files can write the file index sidecar in the folder
+        mtime = os.stat(folder).st_mtime
+        db.execute('insert or replace into folders values (?, ?, ?)', (folder, os.path.dirname(folder), mtime))
+
+    # folders that disappeared below root
+    for folder in known:
+        if folder not in seen and (folder + os.sep).startswith(root + os.sep):
+            db.execute('delete from files where folder = ?', (folder,))
+            db.execute('delete from folders where path = ?', (folder,))
+
+    db.commit()
+    db.close()
+
+    return nfolders, nfiles
+
+
+def catalog_files(instrument, start=None, end=None, filename=catalog_file):
+    """
+    files of an instrument (data format) with profiles between start and end
+    (datetime, datetime64 or date string, None for no limit), in time order
+    """
+
+    query = 'select path from files where instrument = ?'
+    args = [instrument]
+    if start is not None:
+        query += ' and end >= ?'
+        args.append(_time_text(start))
+    if end is not None:
+        query += ' and start <= ?'
+        args.append(_time_text(end))
+    query += ' order by start, path'
+
+    db = catalog_connect(filename)
+    files = [path for path, in db.execute(query, args)]
+    db.close()
+
+    return files
+
+
+def catalog_days(instrument, filename=catalog_file):
+    """
+    days with files of an instrument : list of (day, number of files, first profile, last profile)
+    """
+
+    db = catalog_connect(filename)
+    days = db.execute('select day, count(*), min(start), max(end) from files where instrument = ? '
+                      'group by day order by day', (instrument,)).fetchall()
+    db.close()
+
+    return days
+
+
+def catalog_instruments(filename=catalog_file):
+    """
+    instruments in the catalog : list of (instrument, number of files, first profile, last profile)
+    """
+
+    db = catalog_connect(filename)
+    instruments = db.execute('select instrument, count(*), min(start), max(end) from files '
+                             'group by instrument order by instrument').fetchall()
+    db.close()
+
+    return instruments
+
+
+def main():
+
+    import sys
+    import time
+    from lidardata import catalog_update
+
+    root = sys.argv[1] if len(sys.argv) > 1 else basesirta_path
+    start = time.time()
+    nfolders, nfiles = catalog_update(root)
+    print 'Scanned %s in %.1f s : %d folders listed, %d files described' % (root, time.time() - start, nfolders, nfiles)
+    for instrument, nfiles, first, last in catalog_instruments():
+        print '%12s : %6d files from %s to %s' % (instrument, nfiles, first, last)
+
+
+class test(unittest.TestCase):
+
+    def test_scan_appended(self):
+        import shutil, tempfile
+        from fileindex import file_index_entry
+        
+        def describe(path, format):
+            # one profile per minute, one per line
+            nprof = len(open(path).readlines())
+            start = np.datetime64('2011-07-05T06:00:00')
+            return file_index_entry(start, start + np.timedelta64(nprof - 1, 'm'), nprof, ['a'], [0., 1.])
+            
+        file_format = lambda path: 'lines' if path.endswith('.txt') else None
+        file_index_function = lambda format: describe
+        root = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(root, 'catalog.sqlite')
+            os.mkdir(os.path.join(root, 'day'))
+            datafile = os.path.join(root, 'day', 'data.txt')
+            open(datafile, 'w').write('1\n2\n')
+            catalog_scan(root, file_format, file_index_function, filename=filename)
+            # folder modification time that can be set again exactly
+            mtime = int(os.stat(os.path.join(root, 'day')).st_mtime)
+            os.utime(os.path.join(root, 'day'), (mtime, mtime))
+            catalog_scan(root, file_format, file_index_function, filename=filename)
+            self.assertEqual(catalog_files('lines', '2011-07-05 06:05:00', filename=filename), [])
+            # the file is written, its folder does not change
+            open(datafile, 'a').write('3\n4\n5\n6\n7\n8\n')
+            os.utime(os.path.join(root, 'day'), (mtime, mtime))
+            self.assertEqual(catalog_scan(root, file_format, file_index_function, filename=filename)[1], 1)
+            self.assertEqual(catalog_files('lines', '2011-07-05 06:05:00', filename=filename), [datafile])
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+datacache.py
+
+On-disk cache of datasets ready to display : data arrays regridded in time,
+time and altitude vectors, and metadata.
+
+Each dataset is stored uncompressed in its own folder, one .npy file per array,
+so it can be memory-mapped when opened again. Only the channels that were read
+are saved, and channels are added to the dataset as they are read. Datasets are
+identified by their source path, size and modification time of the source files,
+the content of the dataformats file and read options. When the cache grows beyond
+its size, the least recently used datasets are removed.
+"""
+
+import os
+import glob
+import json
+import shutil
+import hashlib
+from datetime import datetime
+import numpy as np
+
+from config import cache_path, data_cache_size
+from util import LazyData
+from formats import dataformats_file
+
+
+data_cache_path = os.path.join(cache_path, 'data')
+time_format = '%Y-%m-%d %H:%M:%S'
+
+
+def cache_key(source, options, files=None):
+    """
+    identifies a dataset from its source (file or folder), the state of its files,
+    the dataformats file and the read options (must have a stable repr)
+    files are the data files of the source, listed from the source if not given
+    """
+
+    if files is None:
+        source = os.path.abspath(source)
+        if os.path.isdir(source):
+            files = sorted(glob.glob(source + '/*'))
+        else:
+            files = [source]
+
+    key = hashlib.sha1(source)
+    for datafile in files:
+        stat = os.stat(datafile)
+        key.update('%s %d %r' % (os.path.basename(datafile), stat.st_size, stat.st_mtime))
+    f = open(dataformats_file, 'r')
+    key.update(f.read())
+    f.close()
+    key.update(repr(options))
+
+    return key.hexdigest()
+
+
+def cache_exists(key):
+    
+    return os.path.isfile(os.path.join(data_cache_path, key, 'meta.json'))
+
+
+def _channel_file(folder, name):
+    return os.path.join(folder, 'channel_%s.npy' % hashlib.sha1(name.encode('utf-8')).hexdigest()[:16])
+
+
+def _meta_read(folder):
+
+    try:
+        f = open(os.path.join(folder, 'meta.json'), 'r')
+        meta = json.load(f)
+        f.close()
+    except (IOError, ValueError):
+        return None
+    return meta
+
+
+def _meta_write(folder, meta):
+    """
+    writes the description of a cached dataset, replaced at once
+    """
+
+    tmpfile = os.path.join(folder, 'meta.json.%d.tmp' % os.getpid())
+    f = open(tmpfile, 'w')
+    json.dump(meta, f)
+    f.close()
+    os.rename(tmpfile, os.path.join(folder, 'meta.json'))
+
+
+def cache_load(key):
+    """
+    opens a cached dataset, with arrays memory-mapped from the cache.
+    returns a dictionary with time, alt, data, date, filetype, or None if the dataset is not in cache.
+    data only has the channels saved so far, source_channels are all the channels of the dataset.
+    """
+
+    folder = os.path.join(data_cache_path, key)
+    meta = _meta_read(folder)
+    if meta is None:
+        return None
+
+    # last access time, for eviction
+    os.utime(folder, None)
+
+    loaders = dict()
+    for name in meta['channels']:
+        loaders[str(name)] = _mmap_loader(_channel_file(folder, name))
+
+    lidar_data = {'time':np.load(os.path.join(folder, 'time.npy'), mmap_mode='r'),
+                  'alt':np.load(os.path.join(folder, 'alt.npy'), mmap_mode='r'),
+                  'data':LazyData(loaders),
+                  'date':datetime.strptime(meta['date'], time_format),
+                  'filetype':meta['filetype'],
+                  'source_channels':[str(name) for name in meta['source_channels']]}
+
+    return lidar_data
+
+
+class _mmap_loader(object):
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __call__(self):
+        return np.load(self.filename, mmap_mode='r')
+
+
+def cache_save(key, lidar_data, channels):
+    """
+    saves channels of a dataset (dictionary with time, alt, data, date, filetype, source_channels) 
+    in the cache, added to the channels saved before. channels are read and saved one at a time.
+    """
+
+    folder = os.path.join(data_cache_path, key)
+    try:
+        if _meta_read(folder) is None:
+            # time, altitudes and description, without channels
+            tmpfolder = folder + '.%d.tmp' % os.getpid()
+            os.makedirs(tmpfolder)
+            np.save(os.path.join(tmpfolder, 'time.npy'), lidar_data['time'])
+            np.save(os.path.join(tmpfolder, 'alt.npy'), lidar_data['alt'])
+            _meta_write(tmpfolder, {'channels':[], 'source_channels':sorted(lidar_data['source_channels']),
+                                    'date':lidar_data['date'].strftime(time_format), 'filetype':lidar_data['filetype']})
+            try:
+                os.rename(tmpfolder, folder)
+            except OSError:
+                # saved by another program meanwhile
+                shutil.rmtree(tmpfolder, ignore_errors=True)
+                
+        for name in channels:
+            meta = _meta_read(folder)
+            if name in meta['channels']:
+                continue
+            # a channel is in the dataset once completely saved
+            tmpfile = _channel_file(folder, name) + '.%d.tmp' % os.getpid()
+            f = open(tmpfile, 'wb')
+            np.save(f, lidar_data['data'][name])
+            f.close()
+            os.rename(tmpfile, _channel_file(folder, name))
+            meta['channels'].append(name)
+            _meta_write(folder, meta)
+    except (IOError, OSError) as inst:
+        print 'Could not save dataset in cache : ', inst
+        return
+
+    cache_evict(data_cache_size)
+
+
+def _folder_size(folder):
+    return sum(os.path.getsize(f) for f in glob.glob(folder + '/*'))
+
+
+def _process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def cache_evict(max_size):
+    """
+    removes the least recently used datasets until the cache is smaller than max_size bytes,
+    and the datasets and channels left incomplete by programs that stopped while saving them
+    """
+
+    for tmpfile in glob.glob(data_cache_path + '/*.tmp') + glob.glob(data_cache_path + '/*/*.tmp'):
+        pid = int(tmpfile.split('.')[-2])
+        if pid != os.getpid() and not _process_running(pid):
+            if os.path.isdir(tmpfile):
+                shutil.rmtree(tmpfile, ignore_errors=True)
+            else:
+                try:
+                    os.remove(tmpfile)
+                except OSError:
+                    pass
+
+    folders = [f for f in glob.glob(data_cache_path + '/*') if not f.endswith('.tmp')]
+    folders.sort(key=os.path.getmtime, reverse=True)
+
+    size = 0
+    for folder in folders:
+        size += _folder_size(folder)
+        if size > max_size:
+            print 'Removing dataset from cache : ', folder
+            shutil.rmtree(folder, ignore_errors=True)
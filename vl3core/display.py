@@ -0,0 +1,502 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+display.py
+
+Data arrays as they are shown in vl3 curtain and profile plots,
+and their color scale. Used by the vl3 windows and the quicklook renderer.
+"""
+
+import unittest
+import numpy as np
+from functools import partial
+
+from util import pool_map, buffer_append
+from config import lod_min_size, histogram_bins_per_decade, color_scale_percentiles
+
+
+def _transform_profiles(data, denum, out, r2, log_scale, ratio_limits, rows):
+    """
+    display transform of profiles rows of data, in place in out[rows]
+    """
+
+    shown = out[rows]
+
+    if denum is not None:
+        num, denum = data[rows], denum[rows]
+        np.divide(num, denum, out=shown)
+        ratio_min, ratio_max, invalid = ratio_limits
+        masked = (denum < invalid) | (num < invalid) | (shown < ratio_min) | (shown > ratio_max)
+        np.copyto(shown, np.nan, where=masked)
+    else:
+        np.copyto(shown, data[rows])
+
+    if r2 is not None:
+        np.multiply(shown, r2, out=shown)
+
+    if log_scale:
+        positive = shown > 0
+        np.log10(shown, out=shown, where=positive)
+        # values <= 0 are nan
+        np.copyto(shown, np.nan, where=np.logical_not(positive, out=positive))
+
+
+def display_transform(data, alt=None, log_scale=False, range_correct=False, denum=None, out=None,
+                      workers=1, chunk=1024, ratio_min=0, ratio_max=10, invalid=-998):
+    """
+    data as shown in vl3 plots (profiles, or a single profile : altitude is the last axis),
+    in a float32 array (out if given, can be data itself) :
+    the ratio data/denum if denum is given (see util.signal_ratio),
+    range-corrected by alt**2 and/or in log10 scale (values <= 0 are nan).
+    all steps are done in place, chunk profiles at a time, by a pool of workers threads.
+    """
+
+    data = np.asarray(data)
+    if out is None:
+        out = np.empty(data.shape, dtype=np.float32)
+    r2 = np.power(alt, 2, dtype=out.dtype) if range_correct else None
+    transform = partial(_transform_profiles, data, denum, out, r2, log_scale, (ratio_min, ratio_max, invalid))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if data.ndim == 1:
+            transform(Ellipsis)
+        else:
+            pool_map(transform, [slice(start, start + chunk) for start in range(0, len(data), chunk)], workers)
+
+    return out
+
+
+class Histogram(object):
+    """
+    histogram of values in bins of equal width in log10 of their magnitude : bins_per_decade bins
+    per decade of positive and of negative values, from 1e-40 to 1e40 (smaller magnitudes are counted
+    in a single bin around zero). bins do not depend on the values, so outliers do not change
+    the resolution of percentiles, and histograms of chunks of values add up to the histogram of all values.
+    """
+
+    decades = (-40, 40)
+
+    def __init__(self, bins_per_decade=histogram_bins_per_decade):
+
+        self.bins_per_decade = bins_per_decade
+        self.nmagnitudes = (self.decades[1] - self.decades[0]) * bins_per_decade
+        # negative values by decreasing magnitude, zero, positive values by increasing magnitude
+        self.counts = np.zeros(2 * self.nmagnitudes + 1, dtype=np.int64)
+        self.vmin = np.inf
+        self.vmax = -np.inf
+
+    def add(self, values, weight=1):
+        """
+        adds the finite values of an array to the histogram.
+        weight -1 removes values added before (the smallest and largest values are kept).
+        """
+
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+
+        if weight > 0:
+            self.vmin = min(self.vmin, values.min())
+            self.vmax = max(self.vmax, values.max())
+
+        n = self.nmagnitudes
+        with np.errstate(divide='ignore'):
+            magnitudes = np.floor((np.log10(np.abs(values, dtype=float)) - self.decades[0]) * self.bins_per_decade)
+        # -1 for magnitudes too small
+        magnitudes = np.clip(magnitudes, -1, n - 1).astype(np.intp)
+        ibins = np.where(values > 0, n + 1 + magnitudes, n - 1 - magnitudes)
+        ibins[magnitudes < 0] = n
+        self.counts += weight * np.bincount(ibins, minlength=len(self.counts))
+
+    def edges(self):
+        """
+        lower and upper values of bins
+        """
+
+        n = self.nmagnitudes
+        magnitudes = np.power(10., self.decades[0] + np.arange(n + 1) / float(self.bins_per_decade))
+        lower = np.concatenate([-magnitudes[n:0:-1], [-magnitudes[0]], magnitudes[:n]])
+        upper = np.concatenate([-magnitudes[n-1::-1], [magnitudes[0]], magnitudes[1:]])
+        return lower, upper
+
+    def bins(self, low=None, high=None):
+        """
+        values at the center of bins, and their counts, for the bins from the one with low
+        to the one with high (default : smallest and largest values)
+        """
+
+        lower, upper = self.edges()
+        if self.vmin > self.vmax:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        low = self.vmin if low is None else low
+        high = self.vmax if high is None else high
+        first, last = np.searchsorted(upper, low, side='right'), np.searchsorted(lower, high, side='right')
+        return 0.5 * (lower[first:last] + upper[first:last]), self.counts[first:last]
+
+    def percentile(self, q):
+        """
+        value below which q percent of values fall, interpolated in bins.
+        nan if the histogram is empty.
+        """
+
+        cumulated = np.cumsum(self.counts)
+        if cumulated[-1] == 0:
+            return np.nan
+
+        target = q / 100. * cumulated[-1]
+        i = min(np.searchsorted(cumulated, target), len(self.counts) - 1)
+        before = cumulated[i-1] if i > 0 else 0
+        fraction = (target - before) / self.counts[i] if self.counts[i] > 0 else 0.
+        lower, upper = self.edges()
+        value = lower[i] + (upper[i] - lower[i]) * fraction
+
+        return min(max(value, self.vmin), self.vmax)
+
+
+class ColorStatistics(object):
+    """
+    histograms of the displayed values of a channel, in linear and log10 scale,
+    filled in a single pass over chunks of profiles.
+    both histograms can be updated with new profiles, or profiles that change.
+    """
+
+    def __init__(self, bins_per_decade=histogram_bins_per_decade):
+
+        self.linear = Histogram(bins_per_decade)
+        self.log = Histogram(bins_per_decade)
+
+    def update(self, data, alt=None, range_correct=False, chunk=1024, weight=1):
+        """
+        adds profiles (altitude is the last axis) to the histograms,
+        range-corrected by alt**2 if range_correct. weight -1 removes them.
+        """
+
+        for start in range(0, len(data), chunk):
+            values = np.array(data[start:start+chunk], dtype=float)
+            if range_correct:
+                values *= np.power(alt, 2)
+            values = values[np.isfinite(values)]
+            self.linear.add(values, weight)
+            self.log.add(np.log10(values[values > 0]), weight)
+
+    def histogram(self, log_scale=False):
+
+        return self.log if log_scale else self.linear
+
+    def color_range(self, log_scale=False, percentiles=color_scale_percentiles):
+        """
+        color scale of displayed data, from percentiles of its values
+        """
+
+        histogram = self.histogram(log_scale)
+        return histogram.percentile(percentiles[0]), histogram.percentile(percentiles[1])
+
+
+def _pair_reduce(data, axis, statistic):
+    """
+    min, mean or max of pairs of consecutive elements of data along axis, ignoring nan.
+    with an odd number of elements, the last one is kept alone.
+    """
+
+    data = np.moveaxis(data, axis, 0)
+    n = data.shape[0]
+    first, second = data[0:n-1:2], data[1:n:2]
+
+    if statistic == 'min':
+        reduced = np.fmin(first, second)
+    elif statistic == 'max':
+        reduced = np.fmax(first, second)
+    else:
+        reduced = first + second
+        reduced *= 0.5
+        # pairs with a nan : mean of the valid element
+        invalid = np.isnan(reduced)
+        reduced[invalid] = np.fmax(first[invalid], second[invalid])
+
+    if n % 2:
+        reduced = np.concatenate([reduced, data[-1:]])
+
+    return np.moveaxis(reduced, 0, axis)
+
+
+class LodPyramid(object):
+    """
+    levels of detail of a displayed array (profiles * gates), with time and alt coordinates.
+    each level merges 2 profiles and/or 2 gates of the previous level,
+    as long as it keeps at least min_size profiles or gates,
+    and keeps their min, mean and max (mean of the means of the previous level).
+    level 0 is the full resolution array.
+    profiles can be added with append().
+    """
+
+    statistics = ('min', 'mean', 'max')
+
+    def __init__(self, data, time, alt, min_size=lod_min_size):
+
+        self.alt = np.asarray(alt)
+        self.min_size = min_size
+        # level 0 and time, with room for appended profiles
+        self._data, self._ndata = data, len(data)
+        self._time, self._ntime = np.asarray(time), len(time)
+        self._build()
+
+    def _time_factor(self, nprof):
+        return 2 if nprof >= 2 * self.min_size else 1
+
+    def _reduce(self, data, time_factor, alt_factor, statistic):
+        if time_factor > 1:
+            data = _pair_reduce(data, 0, statistic)
+        if alt_factor > 1:
+            data = _pair_reduce(data, 1, statistic)
+        return data
+
+    def _build(self):
+
+        self.factors = [(1, 1)]
+        # for levels above 0 : merge factors from the previous level, min/mean/max arrays and their length
+        self._steps = [None]
+        self._levels = [None]
+        self._sizes = [self._ndata]
+
+        previous = dict((statistic, self._data[:self._ndata]) for statistic in self.statistics)
+        while True:
+            nprof, ngates = previous['mean'].shape
+            time_factor = self._time_factor(nprof)
+            alt_factor = 2 if ngates >= 2 * self.min_size else 1
+            if time_factor == alt_factor == 1:
+                break
+            level = dict((statistic, self._reduce(previous[statistic], time_factor, alt_factor, statistic)) 
+                         for statistic in self.statistics)
+            self._steps.append((time_factor, alt_factor))
+            self._levels.append(level)
+            self._sizes.append(len(level['mean']))
+            self.factors.append((self.factors[-1][0] * time_factor, self.factors[-1][1] * alt_factor))
+            previous = level
+
+    @property
+    def time(self):
+        return self._time[:self._ntime]
+
+    @property
+    def levels(self):
+        levels = [dict((statistic, self._data[:self._ndata]) for statistic in self.statistics)]
+        for level, size in zip(self._levels[1:], self._sizes[1:]):
+            levels.append(dict((statistic, level[statistic][:size]) for statistic in self.statistics))
+        return levels
+
+    @property
+    def nbytes(self):
+        """
+        memory used by the levels (level 0 is the displayed array)
+        """
+
+        return self._data.nbytes + sum(level[statistic].nbytes for level in self._levels[1:]
+                                       for statistic in self.statistics)
+
+    def append(self, data, time, start=None):
+        """
+        adds profiles after the last one, or replaces profiles from start with them.
+        only the bins of each level with new profiles are computed, so the cost is 
+        proportional to the number of new profiles (all levels are built again when 
+        the array becomes long enough for a new level).
+        """
+
+        if start is None:
+            if len(data) == 0:
+                return
+            start = self._ndata
+
+        self._data, self._ndata = buffer_append(self._data, start, data)
+        self._time, self._ntime = buffer_append(self._time, start, time)
+        self._sizes[0] = self._ndata
+
+        for i in range(1, len(self._levels)):
+            time_factor, alt_factor = self._steps[i]
+            if self._time_factor(self._sizes[i-1]) != time_factor:
+                self._build()
+                return
+            previous = self.levels[i-1]
+            # first bin with new profiles
+            start = start // time_factor
+            level = self._levels[i]
+            for statistic in self.statistics:
+                reduced = self._reduce(previous[statistic][start*time_factor:], time_factor, alt_factor, statistic)
+                level[statistic], self._sizes[i] = buffer_append(level[statistic], start, reduced)
+
+        if self._time_factor(self._sizes[-1]) > 1:
+            self._build()
+
+    def level_for(self, time_range, alt_range, width, height):
+        """
+        coarsest level that still has at least one profile per pixel column (width)
+        and one gate per pixel row (height) in the visible time_range and alt_range
+        """
+
+        nprof = np.diff(np.searchsorted(self.time, time_range))[0]
+        if self.alt[0] > self.alt[-1]:
+            ngates = np.diff(np.searchsorted(-self.alt, [-alt_range[1], -alt_range[0]]))[0]
+        else:
+            ngates = np.diff(np.searchsorted(self.alt, alt_range))[0]
+
+        best = 0
+        for i, (time_factor, alt_factor) in enumerate(self.factors):
+            if nprof >= width * time_factor and ngates >= height * alt_factor:
+                best = i
+        return best
+
+    def level(self, i, statistic='mean'):
+        """
+        data array of level i for a statistic, with its time and alt coordinates
+        (coordinates of the first profile and gate of each bin)
+        """
+
+        time_factor, alt_factor = self.factors[i]
+        return self.levels[i][statistic], self.time[::time_factor], self.alt[::alt_factor]
+
+    def profile_index(self, i, iprof):
+        """
+        index of the first profile merged in profile iprof of level i
+        """
+
+        return iprof * self.factors[i][0]
+
+
+class ProfileMeans(object):
+    """
+    running means over n consecutive profiles of a displayed array (profiles * gates), ignoring nan.
+    cumulative sums along time are computed once, so the mean of any number of profiles
+    is a difference of two of them. they are updated from the first profile that changes
+    when profiles are added to the array, or replaced (see update).
+    """
+
+    def __init__(self, data):
+
+        nprof, ngates = data.shape
+        self.sums = np.zeros([nprof + 1, ngates])
+        self.counts = np.zeros([nprof + 1, ngates], dtype=np.int32)
+        self._size = 1
+        self.update(data, 0)
+
+    def update(self, data, start):
+        """
+        cumulative sums of the displayed array data, computed again from profile start
+        """
+
+        rows = data[start:]
+        valid = np.isfinite(rows)
+        # sums continue from the ones before start
+        sums = np.cumsum(np.concatenate([self.sums[start:start+1], np.where(valid, rows, 0)]), axis=0, dtype=float)
+        counts = np.cumsum(np.concatenate([self.counts[start:start+1], valid]), axis=0, dtype=np.int32)
+        self.sums, self._size = buffer_append(self.sums, start + 1, sums[1:])
+        self.counts, self._size = buffer_append(self.counts, start + 1, counts[1:])
+
+    def mean(self, iprof, n):
+        """
+        mean of the n profiles centered on profile iprof (fewer at the ends of the array)
+        """
+
+        start = max(iprof - (n - 1) // 2, 0)
+        end = min(iprof - (n - 1) // 2 + n, self._size - 1)
+        with np.errstate(invalid='ignore'):
+            profile = (self.sums[end] - self.sums[start]) / (self.counts[end] - self.counts[start])
+        return profile.astype(np.float32)
+
+
+class test(unittest.TestCase):
+
+    def setUp(self):
+        self.alt = np.array([1., 2., 3.])
+        self.data = np.array([[1., 2., -1.], [0., 10., 100.]], dtype=np.float32)
+
+    def test_range_correct(self):
+        shown = display_transform(self.data, self.alt, range_correct=True)
+        np.testing.assert_allclose(shown, [[1., 8., -9.], [0., 40., 900.]])
+
+    def test_log_scale(self):
+        shown = display_transform(self.data, self.alt, log_scale=True)
+        np.testing.assert_allclose(shown, [[0., np.log10(2.), np.nan], [np.nan, 1., 2.]], rtol=1e-6)
+
+    def test_range_correct_log_scale(self):
+        shown = display_transform(self.data[1], self.alt, log_scale=True, range_correct=True)
+        np.testing.assert_allclose(shown, np.log10([np.nan, 40., 900.]), rtol=1e-6)
+
+    def test_ratio(self):
+        denum = np.array([[2., 1., -999.], [1., 2., 5.]], dtype=np.float32)
+        shown = display_transform(self.data, denum=denum)
+        np.testing.assert_allclose(shown, [[0.5, 2., np.nan], [0., 5., np.nan]])
+
+    def test_in_place_chunks(self):
+        data = np.random.rand(100, 30).astype(np.float32)
+        expected = display_transform(data, np.arange(30.), log_scale=True, range_correct=True)
+        shown = display_transform(data, np.arange(30.), log_scale=True, range_correct=True, 
+                                  out=data, workers=3, chunk=7)
+        self.assertIs(shown, data)
+        np.testing.assert_array_equal(shown, expected)
+
+    def test_profile_means(self):
+        data = np.array([[1., np.nan], [2., 4.], [3., 6.], [np.nan, np.nan]], dtype=np.float32)
+        means = ProfileMeans(data)
+        np.testing.assert_array_equal(means.mean(1, 1), data[1])
+        np.testing.assert_array_equal(means.mean(1, 3), [2., 5.])
+        np.testing.assert_array_equal(means.mean(0, 3), [1.5, 4.])
+        np.testing.assert_array_equal(means.mean(3, 1), [np.nan, np.nan])
+
+    def test_profile_means_update(self):
+        data = np.random.RandomState(0).rand(40, 3).astype(np.float32)
+        data[5:9, 1] = np.nan
+        means = ProfileMeans(data[:20])
+        # profiles from 15 replaced, and profiles added
+        data[15:25] += 1
+        means.update(data, 15)
+        expected = ProfileMeans(data)
+        for iprof in (0, 14, 17, 39):
+            np.testing.assert_array_equal(means.mean(iprof, 5), expected.mean(iprof, 5))
+
+    def test_histogram_outliers(self):
+        values = np.linspace(0, 1, 100001)
+        histogram = Histogram()
+        histogram.add(values[:50000])
+        histogram.add(np.append(values[50000:], [1e6, -1e6]))
+        # bins are 10**(1/bins_per_decade) - 1 wide, relative to values
+        np.testing.assert_allclose([histogram.percentile(q) for q in (1, 50, 99)], [0.01, 0.5, 0.99], rtol=0.01)
+        self.assertEqual(histogram.percentile(0), -1e6)
+        self.assertEqual(histogram.percentile(100), 1e6)
+
+    def test_histogram_chunks(self):
+        values = np.random.RandomState(0).randn(1000) * 10.
+        histogram = Histogram()
+        for start in range(0, 1000, 300):
+            histogram.add(values[start:start+300])
+        whole = Histogram()
+        whole.add(values)
+        np.testing.assert_array_equal(histogram.counts, whole.counts)
+        np.testing.assert_allclose([histogram.percentile(q) for q in (10, 90)], np.percentile(values, [10, 90]), rtol=0.01)
+
+    def test_histogram_remove(self):
+        values = np.random.RandomState(0).rand(1000)
+        histogram = Histogram()
+        histogram.add(values)
+        histogram.add(values[800:] + 10)
+        histogram.add(values[800:] + 10, weight=-1)
+        whole = Histogram()
+        whole.add(values)
+        np.testing.assert_array_equal(histogram.counts, whole.counts)
+
+    def test_lod_append(self):
+        data = np.random.rand(300, 40).astype(np.float32)
+        lod = LodPyramid(data[:50].copy(), np.arange(50.), np.arange(40.), min_size=8)
+        lod.append(data[50:123], np.arange(50., 123.))
+        lod.append(data[123:250], np.arange(123., 250.))
+        # profiles from 201 change, e.g. filled by a later file
+        data[201:250] += 1
+        lod.append(data[201:], np.arange(201., 300.), start=201)
+        expected = LodPyramid(data, np.arange(300.), np.arange(40.), min_size=8)
+        self.assertEqual(lod.factors, expected.factors)
+        for i in range(len(lod.factors)):
+            for statistic in LodPyramid.statistics:
+                np.testing.assert_array_equal(lod.level(i, statistic)[0], expected.level(i, statistic)[0])
+                np.testing.assert_array_equal(lod.level(i, statistic)[1], expected.level(i, statistic)[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
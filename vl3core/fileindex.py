@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+fileindex.py
+
+Describes data files from their headers only : time span, channels,
+number of gates and resolution, without reading the data itself.
+
+Descriptions of the files in a folder are kept in a sidecar file in
+that folder (or in the user cache folder if it is not writable), and
+are only recomputed for files whose size or modification time changed.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+import numpy as np
+
+from config import index_sidecar, cache_path
+
+
+time_format = '%Y-%m-%d %H:%M:%S.%f'
+
+# sidecars of a folder can be updated by several readers at the same time
+_lock = threading.Lock()
+
+
+def file_index_entry(start, end, nprof, channels, alt):
+    """
+    builds the description of a file.
+    start, end - datetime64 of the first and last profiles
+    alt - vector of gate altitudes, in km
+    """
+
+    if start is not None:
+        start, end = start.tolist(), end.tolist()
+    if nprof > 1:
+        time_resolution = (end - start).total_seconds() / (nprof - 1)
+    else:
+        time_resolution = None
+    if len(alt) > 1:
+        alt_resolution = float(alt[1] - alt[0])
+    else:
+        alt_resolution = None
+
+    return {'start':start, 'end':end, 'nprof':int(nprof), 'channels':list(channels), 'ngates':len(alt),
+            'alt_resolution':alt_resolution, 'time_resolution':time_resolution}
+
+
+def _sidecar_files(folder):
+    """
+    possible sidecar files for a folder, in order of preference
+    """
+
+    folder = os.path.abspath(folder)
+    user_sidecar = hashlib.sha1(folder).hexdigest() + '.json'
+    return [os.path.join(folder, index_sidecar), os.path.join(cache_path, 'index', user_sidecar)]
+
+
+def _to_json(entry):
+    entry = entry.copy()
+    for key in 'start', 'end':
+        if entry[key] is not None:
+            entry[key] = entry[key].strftime(time_format)
+    return entry
+
+
+def _from_json(entry):
+    for key in 'start', 'end':
+        if entry[key] is not None:
+            entry[key] = datetime.strptime(entry[key], time_format)
+    return entry
+
+
+def _sidecar_read(folder):
+
+    for sidecar in _sidecar_files(folder):
+        try:
+            f = open(sidecar, 'r')
+            index = json.load(f)
+            f.close()
+        except (IOError, ValueError):
+            continue
+        for basefile in index:
+            _from_json(index[basefile])
+        return index
+
+    return dict()
+
+
+def _sidecar_write(folder, index):
+
+    index = dict((basefile, _to_json(index[basefile])) for basefile in index)
+    for sidecar in _sidecar_files(folder):
+        try:
+            if not os.path.isdir(os.path.dirname(sidecar)):
+                os.makedirs(os.path.dirname(sidecar))
+            f = open(sidecar + '.tmp', 'w')
+            json.dump(index, f)
+            f.close()
+            os.rename(sidecar + '.tmp', sidecar)
+            return
+        except (IOError, OSError):
+            continue
+
+    print 'Could not save file index for folder ', folder
+
+
+def files_index(filelist, file_index_function, format):
+    """
+    describes the files in filelist with file_index_function(file, format).
+    returns a dictionary of descriptions, indexed by file name.
+    descriptions are read from the folder sidecars when files did not change.
+    """
+
+    folders = dict()
+    for datafile in filelist:
+        folders.setdefault(os.path.dirname(datafile), []).append(datafile)
+
+    descriptions = dict()
+    with _lock:
+        for folder in folders:
+            index = _sidecar_read(folder)
+            changed = False
+            for datafile in folders[folder]:
+                basefile = os.path.basename(datafile)
+                stat = os.stat(datafile)
+                entry = index.get(basefile)
+                if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+                    entry = file_index_function(datafile, format)
+                    entry.update({'format':format, 'size':stat.st_size, 'mtime':stat.st_mtime})
+                    index[basefile] = entry
+                    changed = True
+                descriptions[datafile] = entry
+            if changed:
+                _sidecar_write(folder, index)
+
+    return descriptions
+
+
+def files_in_time_range(filelist, file_index_function, format, time_range):
+    """
+    selects the files in filelist that contain profiles between time_range[0] and time_range[1]
+    (datetime or datetime64, None for no limit)
+    """
+
+    start, end = time_range
+    index = files_index(filelist, file_index_function, format)
+
+    selected = []
+    for datafile in filelist:
+        entry = index[datafile]
+        if entry['start'] is None:
+            continue
+        if start is not None and np.datetime64(entry['end']) < np.datetime64(start):
+            continue
+        if end is not None and np.datetime64(entry['start']) > np.datetime64(end):
+            continue
+        selected.append(datafile)
+
+    return selected
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+formats.py
+
+Registry of the data formats known to vl3.
+
+The dataformats file (netcdf formats) is read and validated once, when this
+module is imported. Readers of data files (lna binary, netcdf...) register
+themselves with register_reader, with the formats they read and their
+capabilities ; files are then identified and read through the registry.
+"""
+
+import re
+import os
+import json
+
+
+# the dataformats file is next to the vl3 application, above this package
+dataformats_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dataformats')
+
+
+class DataformatsError(Exception):
+    pass
+
+
+def _check(condition, message):
+    if not condition:
+        raise DataformatsError('Invalid dataformats file : ' + message)
+
+
+def _is_text(value):
+    return isinstance(value, basestring)
+
+
+def dataformats_validate(dataformats):
+    """
+    checks the content of a dataformats file, raises DataformatsError if it is not valid
+    """
+
+    _check(isinstance(dataformats, dict), 'not a dictionary')
+    for key in 'vertical', 'horizontal':
+        _check(isinstance(dataformats.get(key), list), '"%s" must be a list of variable names' % key)
+        _check(all(_is_text(name) for name in dataformats[key]), '"%s" must be a list of variable names' % key)
+
+    formats = dataformats.get('lidar_variables')
+    _check(isinstance(formats, dict), '"lidar_variables" must be a dictionary of formats')
+    for format in formats:
+        _check(isinstance(formats[format], dict), 'format %s must be a dictionary of variables' % format)
+        for variable in formats[format]:
+            properties = formats[format][variable]
+            _check(isinstance(properties, dict), 'variable %s/%s must be a dictionary of properties' % (format, variable))
+            for prop in properties:
+                _check(_is_text(properties[prop]) or isinstance(properties[prop], (int, long, float)),
+                       'property %s of variable %s/%s must be a string or a number' % (prop, format, variable))
+
+
+def dataformats_read(filename=dataformats_file):
+    """
+    reads and validates a dataformats file
+    """
+
+    try:
+        f = open(filename, 'r')
+        dataformats = json.load(f)
+        f.close()
+    except (IOError, ValueError) as inst:
+        raise DataformatsError('Could not read dataformats file %s : %s' % (filename, inst))
+    dataformats_validate(dataformats)
+
+    return dataformats
+
+
+class VariableMatcher(object):
+    """
+    properties of a netcdf variable, as (attribute, value) pairs
+    """
+
+    def __init__(self, properties):
+        self.properties = dict(properties)
+        self.items = tuple(sorted(self.properties.items()))
+
+    def match(self, index, variables):
+        """
+        names of the variables that have all the properties.
+        index maps (attribute, value) pairs to the set of variables that have them,
+        variables are all the variables of the file.
+        """
+
+        found = None
+        for item in self.items:
+            with_item = index.get(item, ())
+            found = set(with_item) if found is None else found.intersection(with_item)
+            if not found:
+                return set()
+
+        if found is None:
+            # no properties, any variable would do
+            found = set(variables)
+
+        return found
+
+
+class PrefixMatcher(object):
+    """
+    finds the format of a file from the start and end of its name.
+    prefixes maps file name prefixes to formats, longer prefixes are tried first.
+    """
+
+    def __init__(self, prefixes, suffix=''):
+        self.prefixes = dict(prefixes)
+        alternatives = '|'.join(re.escape(prefix) for prefix in sorted(self.prefixes, key=len, reverse=True))
+        self.regex = re.compile('(%s).*%s$' % (alternatives, re.escape(suffix)))
+
+    def __call__(self, basefile):
+        match = self.regex.match(basefile)
+        if match is None:
+            return None
+        return self.prefixes[match.group(1)]
+
+
+dataformats = dataformats_read()
+vertical_variables = dataformats['vertical']
+horizontal_variables = dataformats['horizontal']
+netcdf_formats = dataformats['lidar_variables']
+# matchers of the variables of each netcdf format
+variable_matchers = dict((format, dict((variable, VariableMatcher(properties))
+                                       for variable, properties in netcdf_formats[format].items()))
+                         for format in netcdf_formats)
+
+
+class DataReader(object):
+    """
+    reader of data files, for one or several formats.
+    file_format(basefile) - format of a file from its name, None if the reader does not read it
+    file_pattern - glob pattern of the files of a format in a folder, {format} is replaced by the format
+    file_read(datafile, format) - reads a file (see lna_binary_file_read)
+    file_open(datafile, format) - opens a file, data is read on access (see lna_binary_file_open)
+    file_index(datafile, format) - describes a file from its header (see fileindex)
+    file_sort_key(datafile) - order of the files of a folder, file names if None
+    capabilities :
+    lazy - file_open is available
+    windowed - file_read and file_open accept time_range and alt_range
+    parallel_safe - several files can be read at the same time in threads
+    """
+
+    def __init__(self, formats, file_format, file_pattern, file_read, file_open=None, file_index=None,
+                 file_sort_key=None, lazy=False, windowed=False, parallel_safe=False):
+
+        self.formats = list(formats)
+        self.file_format = file_format
+        self.file_pattern = file_pattern
+        self.file_read = file_read
+        self.file_open = file_open
+        self.file_index = file_index
+        self.file_sort_key = file_sort_key
+        self.lazy = lazy and file_open is not None
+        self.windowed = windowed
+        self.parallel_safe = parallel_safe
+
+
+_readers = []
+_format_readers = dict()
+
+
+def register_reader(reader):
+    """
+    adds a reader to the registry, for all its formats
+    """
+
+    _readers.append(reader)
+    for format in reader.formats:
+        _format_readers[format] = reader
+
+
+def format_reader(format):
+    """
+    reader registered for a format, None if the format is unknown
+    """
+
+    return _format_readers.get(format)
+
+
+def registered_formats():
+
+    return sorted(_format_readers)
+
+
+def datafile_format(datafile):
+    """
+    format of a data file from its name, None if no reader reads it
+    """
+
+    basefile = os.path.basename(datafile)
+    for reader in _readers:
+        format = reader.file_format(basefile)
+        if format is not None:
+            return format
+
+    return None
+
+
+def print_supported_formats():
+
+    print 'Supported data formats :'
+    for format in registered_formats():
+        print '\t' + format
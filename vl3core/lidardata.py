@@ -0,0 +1,697 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+"""
+lidardata.py
+
+VNoel 2011-10-19
+
+This module contains function to open lidar data files in various
+formats and from various instruments.
+
+File formats must be either lna binary (special case) or netcdf.
+The variables to read in netcdf files are described in a "ini" file
+
+"""
+
+import os
+import copy
+import glob
+import unittest
+from functools import partial
+# readers register their formats when imported
+import lna_bin
+import lidarnetcdf
+from formats import datafile_format, format_reader, registered_formats
+from fileindex import files_index, files_in_time_range
+from catalog import catalog_scan, catalog_files
+import numpy as np
+from threading import Thread
+from util import lazy_apply, datetime64_to_epoch, epoch_to_datetime64, LazyData, MergedData, lidar_multiple_files_read
+from util import bin_profiles, bin_centers, buffer_append
+from datacache import cache_key, cache_load, cache_save, cache_exists
+from config import regrid_time_step, regrid_time_tolerance, data_cache_size, basesirta_path
+
+
+supported_formats = registered_formats()
+
+
+class InvalidFormat(Exception):
+    pass
+
+
+class InvalidFolder(InvalidFormat):
+    pass
+    
+
+class InvalidFile(InvalidFormat):
+    pass
+    
+
+def _buffer_rows(buffers, name, size):
+    
+    return buffers[name][:size]
+    
+    
+def _buffer_new(data):
+    '''
+    copy of data with room for as many profiles again (see util.buffer_append)
+    '''
+    
+    return buffer_append(np.empty((0,) + data.shape[1:], dtype=data.dtype), 0, data)[0]
+    
+
+def _gates_fit(data, ngates):
+    '''
+    data with ngates gates : cut, or completed with nan
+    '''
+    
+    if data.shape[1] >= ngates:
+        return data[:, :ngates]
+    filled = np.full([data.shape[0], ngates], np.nan, dtype=data.dtype)
+    filled[:, :data.shape[1]] = data
+    return filled
+    
+    
+def _read_only(array):
+    
+    view = array.view()
+    view.flags.writeable = False
+    return view
+    
+
+class LidarData(object):
+    
+    '''
+    LidarData class
+    contains data that wants to be plotted.
+    data is a dictionary-like object : arrays are read from disk (lna binary or netcdf)
+    and regridded when accessed, the last ones accessed are kept in memory.
+    
+    '''
+    
+    def __init__(self, from_source=None, workers=None, time_range=None, time_step=regrid_time_step, time_tolerance=regrid_time_tolerance, cache=False, alt_range=None):
+        '''
+        from_source is a file or a folder path, or a catalog query (instrument, start, end)
+        for the files of an instrument in the archive catalog (see catalog_update).
+        workers is the number of files read in parallel in a folder (see config.read_workers)
+        time_range (start, end) : only the files with profiles in that range are read,
+        and only their profiles in that range (datetime or datetime64, None for no limit)
+        alt_range (min, max) : only altitudes in that range (km) are read
+        time_step, time_tolerance : regular time grid of the data, see regrid_time_index
+        if cache is True, channels saved in the data cache are read from it, and channels
+        read can be saved in it (see cache_save, datacache and config.data_cache_size)
+        without from_source, the dataset is empty.
+        '''
+
+        self.time_step = time_step
+        self.time_tolerance = time_tolerance
+        self.read_options = (time_range, alt_range, time_step, time_tolerance)
+        self.data_source = from_source
+        # arrays merged from files (see util.MergedData) and profile of each time of the time grid,
+        # to read profiles from the files that have them (see rows)
+        self._merged = None
+        self._iprofs = None
+        # dataset, profiles and gates per bin, statistic of datasets made by binned()
+        self._binning = None
+        # channel arrays with room for profiles added by extend()
+        self._buffers = None
+        self._read_only = False
+        # rows filled by the last extend(), for each channel
+        self.filled = dict()
+        # key in the data cache, computed before the read, and channels read from the cache
+        self._cache_key = None
+        self._cached = set()
+
+        if from_source:
+            cached = None
+            if cache:
+                self._cache_key = self.cache_key()
+            if self._cache_key is not None:
+                cached = cache_load(self._cache_key)
+                
+            if cached is not None and set(cached['data'].keys()) >= set(cached['source_channels']):
+                print 'Opening dataset from cache'
+                self._set_data(cached)
+                self._cached = set(cached['data'].keys())
+                
+            else:
+                data = self._read(from_source, workers, time_range, alt_range)
+                self._set_data(data)
+                self._data_regrid_time(time_step, time_tolerance)
+                if cached is not None:
+                    self._cache_use(cached)
+
+
+    def cache_key(self):
+        
+        return _cache_key(self.data_source, self.read_options)
+        
+        
+    def cache_save(self, channels, key=None):
+        '''
+        adds channels to the dataset in the data cache, e.g. channels just read and shown.
+        channels are read and saved one by one, in a background thread that does not
+        keep the program running : a channel not completely saved is not in the cache.
+        key is the cache key of the dataset computed before it was read (see cache_key),
+        so that files written during the read are read again when the dataset is opened again.
+        nothing is saved without key, if the dataset was not opened with cache.
+        '''
+        
+        if key is None:
+            key = self._cache_key
+        channels = [name for name in channels if name not in self._cached]
+        if key is None or not channels:
+            return
+        data = {'time':self.datetime, 'alt':self.alt, 'data':LazyData(self.data.loaders), 
+                'date':self.date, 'filetype':self.filetype, 'source_channels':self.data.keys()}
+        writer = Thread(target=cache_save, args=(key, data, channels))
+        writer.daemon = True
+        writer.start()
+        
+        
+    def _cache_use(self, cached):
+        '''
+        channels saved in the data cache (see cache_load) are read from it, not from the files
+        '''
+        
+        self._cached = set(cached['data'].keys())
+        loaders = dict(self.data.loaders)
+        loaders.update(cached['data'].loaders)
+        self.data = LazyData(loaders, keep=self.data.keep)
+        
+        
+    def rows(self, name, start=0, end=None):
+        '''
+        profiles start to end of a channel. only the files with these profiles are read,
+        and for binned datasets only the profiles of these bins.
+        '''
+        
+        end = len(self.datetime) if end is None else min(end, len(self.datetime))
+        if self._binning is not None:
+            dataset, nprofs, ngates, statistic = self._binning
+            return bin_profiles(dataset.rows(name, start * nprofs, end * nprofs), nprofs, ngates, statistic)
+            
+        if self._merged is not None and name not in self._cached:
+            iprofs = self._iprofs[start:end]
+            valid = iprofs[iprofs >= 0]
+            if len(valid) > 0:
+                first = valid.min()
+                merged = self._merged.rows(name, first, valid.max() + 1)
+                if merged is not None:
+                    return _regrid_profiles(np.where(iprofs >= 0, iprofs - first, -1), merged)
+                    
+        return self.data[name][start:end]
+        
+        
+    def row_blocks(self, name):
+        '''
+        ranges of profiles (start, end) covering the dataset, each with the profiles of a channel
+        from one file (the first one starts at 0) : a channel can be read block by block with rows().
+        '''
+        
+        nprof = len(self.datetime)
+        if self._binning is not None:
+            dataset, nprofs, ngates, statistic = self._binning
+            starts = [start // nprofs for start, end in dataset.row_blocks(name)]
+        elif self._merged is not None and name not in self._cached:
+            # first time of the grid using each file
+            starts = np.searchsorted(np.maximum.accumulate(self._iprofs), self._merged.starts(name))
+        else:
+            starts = [0]
+            
+        starts = np.unique(np.clip(starts, 0, nprof))
+        starts = starts[starts < nprof]
+        starts[0] = 0
+        ends = np.append(starts[1:], nprof)
+        
+        return zip(starts, ends)
+        
+
+    def binned(self, nprofs, ngates, statistic='mean'):
+        '''
+        new dataset with data aggregated in bins of nprofs profiles * ngates gates,
+        with statistic 'mean', 'median', 'count' or 'sum' (see util.bin_profiles).
+        binned arrays are computed when accessed, times and altitudes are the centers of bins.
+        '''
+        
+        binned = LidarData(time_step=self.time_step, time_tolerance=self.time_tolerance)
+        binned.data_source = self.data_source
+        binned.read_options = self.read_options + ((nprofs, ngates, statistic),)
+        binned._binning = (self, nprofs, ngates, statistic)
+        binned._set_data({'time':epoch_to_datetime64(bin_centers(self.epochtime, nprofs)),
+                          'alt':bin_centers(self.alt, ngates), 
+                          'data':lazy_apply(partial(bin_profiles, nprofs=nprofs, ngates=ngates, statistic=statistic), 
+                                            self.data, keep=2),
+                          'date':self.date, 'filetype':self.filetype})
+        return binned
+        
+        
+    def extend(self, data):
+        '''
+        adds profiles recorded after the last profile of the dataset, e.g. read from files
+        being written (see lna_bin.LnaBinaryFollower). new profiles are put on the time grid
+        of the dataset, and copied at the end of channel arrays that keep room for more profiles : 
+        the cost only depends on the number of new profiles (the first call builds all channels).
+        profiles at times of the dataset fill the rows of channels without data, e.g. profiles of 
+        a field of view written later than the other one (see last_time).
+        returns the number of profiles added, and the rows filled in each channel in self.filled.
+        '''
+        
+        self.filled.clear()
+        if self._buffers is None:
+            # channels are copied, arrays of the data read can be shared with other datasets
+            self._buffers = dict((name, _buffer_new(np.asarray(self.data[name]))) for name in self.data)
+        nprof = size = len(self.datetime)
+        
+        old = data['time'] <= self.datetime[-1]
+        if np.any(old):
+            self._fill(data, old)
+            
+        new = ~old
+        if np.any(new):
+            # continue the time grid after the last profile, which can still be the closest one
+            step = int((self.datetime[-1] - self.datetime[-2]) / np.timedelta64(1, 's')) if len(self.datetime) > 1 else self.time_step
+            time = np.concatenate([self.datetime[-1:], data['time'][new]])
+            newtime, iprofs = regrid_time_index(time, step, self.time_tolerance)
+            newtime, iprofs = newtime[1:], iprofs[1:]
+            
+            for name in set(self._buffers) | set(data['data']):
+                # channels can have fewer gates than altitudes
+                ngates = self._buffers[name].shape[1] if name in self._buffers else len(self.alt)
+                if name in data['data']:
+                    values = _gates_fit(np.asarray(data['data'][name])[new], ngates)
+                    if name in self._buffers:
+                        last = self._buffers[name][nprof-1:nprof]
+                    else:
+                        last = np.full([1, ngates], np.nan, dtype=values.dtype)
+                    values = _regrid_profiles(iprofs, np.concatenate([last, values]))
+                else:
+                    values = np.full([len(newtime), ngates], np.nan, dtype=np.float32)
+                if name not in self._buffers:
+                    self._buffers[name] = np.full([nprof, ngates], np.nan, dtype=values.dtype)
+                self._buffers[name], size = buffer_append(self._buffers[name], nprof, values)
+            self._set_time(np.concatenate([self.datetime, newtime]))
+        elif not self.filled:
+            return 0
+            
+        self._merged = None
+        # the dataset is not the one in the data cache anymore
+        self._cache_key = None
+        self._cached = set()
+        self.data = LazyData(dict((name, partial(_buffer_rows, self._buffers, name, size)) for name in self._buffers))
+        if self._read_only:
+            self.set_read_only()
+            
+        return len(self.datetime) - nprof
+        
+        
+    def _fill(self, data, profiles):
+        '''
+        writes the selected profiles of data in the rows of the closest times of the dataset,
+        for channels without data in these rows. filled rows are kept in self.filled.
+        '''
+        
+        nprof = len(self.datetime)
+        time = data['time'][profiles]
+        irows = np.clip(np.searchsorted(self.datetime, time), 0, nprof - 1)
+        before = np.maximum(irows - 1, 0)
+        irows = np.where(time - self.datetime[before] <= self.datetime[irows] - time, before, irows)
+        step = self.datetime[1] - self.datetime[0] if nprof > 1 else np.timedelta64(1, 's')
+        tolerance = step if self.time_tolerance is None else np.timedelta64(self.time_tolerance, 's')
+        close = np.abs(self.datetime[irows] - time) <= tolerance
+        
+        for name, values in data['data'].items():
+            ngates = self._buffers[name].shape[1] if name in self._buffers else len(self.alt)
+            values = _gates_fit(np.asarray(values)[profiles][close], ngates)
+            if name not in self._buffers:
+                self._buffers[name] = np.full([nprof, ngates], np.nan, dtype=np.result_type(values.dtype, np.float32))
+            buffer = self._buffers[name]
+            empty = np.all(np.isnan(buffer[irows[close]]), axis=1)
+            if not np.any(empty):
+                continue
+            # the first profile of a row is kept, like in merged files
+            rows, first = np.unique(irows[close][empty], return_index=True)
+            buffer[rows] = values[empty][first]
+            self.filled[name] = rows
+            
+            
+    def last_time(self):
+        '''
+        time of the last profile with data in every channel, None if a channel has no data.
+        channels written at different times (e.g. narrow and wide field of view lna files)
+        are complete until then.
+        '''
+        
+        end = len(self.datetime)
+        for name in self.data.keys():
+            # search backward, by blocks of growing size
+            last, size = end, 16
+            while last > 0:
+                start = max(0, last - size)
+                valid = np.flatnonzero(np.any(np.isfinite(self.rows(name, start, last)), axis=1))
+                if len(valid) > 0:
+                    break
+                last, size = start, 2 * size
+            if last == 0:
+                return None
+            end = start + valid[-1] + 1
+            
+        return self.datetime[end - 1]
+        
+        
+    def copy(self):
+        '''
+        dataset with the same profiles, which can be extended without changing this one.
+        arrays are shared until then.
+        '''
+        
+        lidardata = copy.copy(self)
+        lidardata._buffers = None
+        lidardata._read_only = False
+        lidardata.filled = dict()
+        return lidardata
+        
+        
+    def set_read_only(self):
+        '''
+        data arrays become read-only views, for datasets shared between windows.
+        '''
+        
+        self._read_only = True
+        self.data = lazy_apply(_read_only, self.data)
+        
+
+    def _read(self, from_source, workers, time_range, alt_range):
+        
+        if isinstance(from_source, tuple):
+            return self._read_query(from_source, workers, time_range, alt_range)
+            
+        folder, format = source_identify(from_source)
+        if format is None:
+            if folder:
+                raise InvalidFolder('This folder does not contain files of known format. Valid formats : ' + str(supported_formats))
+            else:
+                raise InvalidFile('This file is not of a known format. Valid formats : ' + str(supported_formats))
+
+        if folder:
+            format, files = source_files(from_source, time_range)
+        else:
+            files = [from_source]
+        data = files_open(files, format, workers, time_range, alt_range)
+
+        if data is None:
+            if folder:
+                raise InvalidFolder('This folder does not contain data in the requested time range')
+            else:
+                raise InvalidFile('This file does not contain data in the requested time range')
+            
+        return data
+        
+        
+    def _read_query(self, query, workers, time_range, alt_range):
+        '''
+        reads the files of a catalog query (instrument, start, end), across day folders.
+        only profiles between start and end are read.
+        '''
+        
+        instrument, start, end = query
+        if time_range is None:
+            time_range = (start, end)
+        files = catalog_files(instrument, *time_range)
+        data = files_open(files, instrument, workers, time_range, alt_range)
+        
+        if data is None:
+            raise InvalidFormat('The archive catalog has no %s data in the requested time range' % instrument)
+            
+        return data
+        
+
+    def _set_data(self, data):
+        
+        self.data = data['data']
+        self._merged = data['data'] if isinstance(data['data'], MergedData) else None
+        self._iprofs = None
+        self._set_time(data['time'])
+        self.alt = data['alt']
+        self.date = data['date']
+        self.filetype = data['filetype']
+        self.alt_range = (np.min(self.alt), np.max(self.alt))
+        
+        
+    def _set_time(self, time):
+        
+        self.datetime = time
+        self.epochtime = datetime64_to_epoch(self.datetime)
+        self.epochtime_range = np.min(self.epochtime), np.max(self.epochtime)
+        
+
+    def _data_regrid_time(self, step, tolerance, keep=2):
+        '''
+        put data on a regular time grid.
+        the profile to use for each time step is found once for all variables,
+        variables are regridded when accessed.
+        '''
+
+        newtime, iprofs = regrid_time_index(self.datetime, step, tolerance)
+
+        self.data = lazy_apply(partial(_regrid_profiles, iprofs), self.data, keep=keep)
+        self._iprofs = iprofs
+        self._set_time(newtime)
+        
+
+def source_identify(source):
+    '''
+    Finds out the type of data in a given source
+    source is a string containing either a file or a folder path.
+    
+    returns a tuple : (folder = True/False, format = string)
+    format is one of the formats of the registry (see formats), e.g. "lnabinary", or netcdf formats : lna, als
+    '''
+    
+    folder = False
+    if os.path.isdir(source):
+        folder = True
+        files = glob.glob(source + '/*')
+        format = None
+        while files and (format is None):
+            format = datafile_format(files.pop())
+        if format:
+            print 'Source is folder, datatype ' + format
+    else:
+        format = datafile_format(source)
+        if format:
+            print 'Source is file, datatype ' + format
+
+    return folder, format
+    
+    
+def _cache_key(source, read_options):
+    
+    if data_cache_size <= 0:
+        return None
+    if isinstance(source, tuple):
+        # catalog query
+        instrument, start, end = source
+        time_range = read_options[0] or (start, end)
+        return cache_key(repr(source), read_options, files=catalog_files(instrument, *time_range))
+    return cache_key(source, read_options)
+    
+    
+def source_cache_key(source, time_range=None, time_step=regrid_time_step, time_tolerance=regrid_time_tolerance, alt_range=None):
+    '''
+    key of the dataset read from source with these options in the data cache (see LidarData.cache_save),
+    None if the data cache is disabled
+    '''
+    
+    return _cache_key(source, (time_range, alt_range, time_step, time_tolerance))
+    
+    
+def source_cached(source, time_range=None, time_step=regrid_time_step, time_tolerance=regrid_time_tolerance, alt_range=None):
+    '''
+    True if the dataset read from source with these options is in the data cache
+    '''
+    
+    key = source_cache_key(source, time_range, time_step, time_tolerance, alt_range)
+    return key is not None and cache_exists(key)
+
+
+def source_files(source, time_range=None):
+    '''
+    lists the data files in a source (file or folder) in time order, and their format.
+    if time_range is given (start, end), only files with profiles in that range are listed.
+    '''
+
+    folder, format = source_identify(source)
+    if format is None or not folder:
+        return format, [source] if format else []
+
+    reader = format_reader(format)
+    files = glob.glob(source + '/' + reader.file_pattern.format(format=format))
+
+    if time_range is not None:
+        files = files_in_time_range(files, reader.file_index, format, time_range)
+        
+    files.sort(key=reader.file_sort_key)
+
+    return format, files
+
+
+def file_read(datafile, format):
+    '''
+    reads all the data in a file of a given format
+    '''
+
+    return format_reader(format).file_read(datafile, format)
+
+
+def files_open(files, format, workers=None, time_range=None, alt_range=None):
+    '''
+    opens the files of a given format, and merges them.
+    with the capabilities of the format reader : data is read on access (lazy),
+    only in time_range and alt_range (windowed), files are read in parallel (parallel_safe).
+    returns None if there is no data.
+    '''
+    
+    reader = format_reader(format)
+    file_read_function = reader.file_open if reader.lazy else reader.file_read
+    if reader.windowed:
+        file_read_function = partial(file_read_function, time_range=time_range, alt_range=alt_range)
+    if not reader.parallel_safe:
+        workers = 1
+        
+    return lidar_multiple_files_read(files, file_read_function, format, workers=workers)
+
+
+def source_index(source):
+    '''
+    describes the files of known format in a source (file or folder) from their headers only.
+    returns a dictionary of descriptions (see fileindex), indexed by file name.
+    '''
+
+    if os.path.isdir(source):
+        files = glob.glob(source + '/*')
+    else:
+        files = [source]
+
+    formats = dict()
+    for datafile in files:
+        format = datafile_format(datafile)
+        if format is not None:
+            formats.setdefault(format, []).append(datafile)
+
+    index = dict()
+    for format in formats:
+        index.update(files_index(formats[format], file_index_function(format), format))
+
+    return index
+
+
+def file_index_function(format):
+    '''
+    function describing a file of a given format from its header (see fileindex)
+    '''
+    
+    return format_reader(format).file_index
+
+
+def catalog_update(root=basesirta_path, full=False):
+    '''
+    scans an archive tree and updates the catalog of its data files (see catalog).
+    only folders that changed since the last scan are listed, unless full is True.
+    '''
+    
+    return catalog_scan(root, datafile_format, file_index_function, full=full)
+
+
+def _time_step(numtime, step):
+    '''
+    time step in seconds of a vector of times in seconds.
+    step can be 'median' or 'mode' of the time differences, or a number of seconds
+    '''
+
+    diffs = np.diff(numtime)
+    if step == 'median':
+        step = np.round(np.median(diffs))
+    elif step == 'mode':
+        values, counts = np.unique(diffs, return_counts=True)
+        step = values[np.argmax(counts)]
+    
+    return max(int(step), 1)
+
+
+def regrid_time_index(time, step='median', tolerance=None):
+    '''
+    builds a regular time grid from time (datetime64 vector, sorted)
+    from the first to the last profile, with the given step (see _time_step).
+    returns the new time vector, and the index of the closest profile for each new time,
+    or -1 if there is no profile closer than tolerance (seconds, default : step).
+    '''
+
+    numtime = time.astype('datetime64[s]').astype('i8')
+    if len(numtime) < 2:
+        return time, np.arange(len(numtime))
+
+    step = _time_step(numtime, step)
+    if tolerance is None:
+        tolerance = step
+
+    newtime = np.arange(time[0], time[-1] + np.timedelta64(step, 's'), np.timedelta64(step, 's'))
+    numnewtime = newtime.astype('datetime64[s]').astype('i8')
+
+    # closest profile is either just before or just after each new time
+    after = np.clip(np.searchsorted(numtime, numnewtime), 1, len(numtime) - 1)
+    before = after - 1
+    closer_before = (numnewtime - numtime[before]) <= (numtime[after] - numnewtime)
+    iprofs = np.where(closer_before, before, after)
+
+    iprofs[np.abs(numnewtime - numtime[iprofs]) > tolerance] = -1
+
+    return newtime, iprofs
+
+
+def _regrid_profiles(iprofs, data):
+    '''
+    picks profiles iprofs in data, -1 means no profile.
+    integer data is converted to float, to hold nan for missing profiles.
+    '''
+
+    newdata = np.take(data, iprofs, axis=0)
+    dtype = np.result_type(newdata.dtype, np.float32)
+    if newdata.dtype != dtype:
+        newdata = newdata.astype(dtype)
+    newdata[iprofs < 0] = np.nan
+
+    return newdata
+
+
+class test(unittest.TestCase):
+
+    def test_regrid_integer(self):
+        # e.g. byte flags of netcdf files, on a time grid with gaps
+        time = np.datetime64('2011-07-05T06:00:00') + np.array([0, 10, 40, 50]).astype('timedelta64[s]')
+        flags = np.arange(8, dtype=np.int8).reshape(4, 2)
+        newtime, iprofs = regrid_time_index(time, step=10, tolerance=4)
+        regridded = _regrid_profiles(iprofs, flags)
+        self.assertEqual(regridded.dtype, np.float32)
+        np.testing.assert_array_equal(regridded, [[0, 1], [2, 3], [np.nan, np.nan], [np.nan, np.nan], [4, 5], [6, 7]])
+
+    def test_copy_extend(self):
+        # a shared dataset, and the copy of a window following its files
+        time = np.datetime64('2011-07-05T06:00:00') + np.arange(8) * np.timedelta64(10, 's')
+        values = np.arange(16, dtype=np.float32).reshape(8, 2)
+        data = values[:6].copy()
+        data[4:] = np.nan
+        shared = LidarData()
+        shared._set_data({'time':time[:6], 'alt':np.arange(2.), 'data':{'a':data}, 'date':None, 'filetype':'binary'})
+        shared.set_read_only()
+        followed = shared.copy()
+        self.assertEqual(followed.extend({'time':time[4:], 'alt':np.arange(2.), 'data':{'a':values[4:]}}), 2)
+        np.testing.assert_array_equal(followed.filled['a'], [4, 5])
+        np.testing.assert_array_equal(followed.data['a'], values)
+        self.assertEqual(len(shared.datetime), 6)
+        np.testing.assert_array_equal(shared.data['a'], data)
+
+
+if __name__ == '__main__':
+    unittest.main()
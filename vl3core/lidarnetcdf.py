@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+#encoding: utf-8
+
+from functools import partial
+from scipy.io.netcdf import netcdf_file
+import os
+import unittest
+import numpy as np
+from datetime import datetime
+from util import LazyData, window_slice
+from fileindex import file_index_entry
+from formats import vertical_variables, horizontal_variables, netcdf_formats, variable_matchers
+from formats import VariableMatcher, PrefixMatcher, DataReader, register_reader
+
+
+def find_vertical_variable(nc):
+    for varname in nc.variables:
+        if varname in vertical_variables:
+            return varname
+    return None
+    
+
+def find_horizontal_variable(nc):
+    for varname in nc.variables:
+        if varname in horizontal_variables:
+            return varname
+    return None
+    
+
+def _hashable_attributes(netcdfvar):
+    '''
+    attributes of a netcdf variable that can be indexed. only attributes of the file are used,
+    not fields of the variable object (e.g. its shape, which changes with the number of profiles).
+    '''
+    
+    attributes = []
+    for prop, value in netcdfvar._attributes.items():
+        if isinstance(value, np.ndarray):
+            continue
+        try:
+            hash(value)
+        except TypeError:
+            continue
+        attributes.append((prop, value))
+    attributes.sort()
+    
+    return attributes
+    
+    
+def attribute_index(nc):
+    '''
+    maps each (attribute, value) pair to the set of variables of a netcdf file that have it
+    '''
+    
+    index = dict()
+    for varname in nc.variables:
+        for attribute in _hashable_attributes(nc.variables[varname]):
+            index.setdefault(attribute, set()).add(varname)
+            
+    return index
+    
+    
+def find_variable(nc, varproperties, index=None):
+    '''
+    finds the name of a variable in a netcdf file based on requested properties
+    (dictionary, or VariableMatcher)
+    index is the attribute index of the file, built if not given.
+    if several variables match, they are reported and no variable is returned.
+    '''
+    
+    if index is None:
+        index = attribute_index(nc)
+    if not isinstance(varproperties, VariableMatcher):
+        varproperties = VariableMatcher(varproperties)
+        
+    found = varproperties.match(index, nc.variables)
+    if not found:
+        return None
+    if len(found) > 1:
+        print 'Error : Several variables in netcdf file have properties', varproperties.properties, ':', sorted(found)
+        return None
+            
+    return found.pop()
+    
+    
+def schema_signature(nc):
+    '''
+    identifies the variables, their dimensions and attributes in a netcdf file.
+    files with more or fewer profiles have the same signature.
+    '''
+    
+    schema = [(varname, tuple(nc.variables[varname].dimensions), tuple(_hashable_attributes(nc.variables[varname]))) 
+              for varname in nc.variables]
+    schema.sort()
+    
+    return hash(tuple(schema))
+    
+    
+# variable names found for each (format, schema signature)
+_resolved_variables = dict()
+
+def resolve_variables(nc, format):
+    '''
+    finds the netcdf variables of a file for all the vl3 variables of a format.
+    returns a dictionary {vl3 variable name : netcdf variable name} for the variables found.
+    results are reused for files with the same schema.
+    '''
+    
+    key = (format, schema_signature(nc))
+    if key in _resolved_variables:
+        return _resolved_variables[key]
+        
+    index = attribute_index(nc)
+    variables = dict()
+    for variable, matcher in variable_matchers[format].items():
+        varname = find_variable(nc, matcher, index)
+        if varname is None:
+            print 'Error : Could not find in netcdf file variable with properties', matcher.properties
+        else:
+            variables[variable] = varname
+            
+    _resolved_variables[key] = variables
+    return variables
+    
+    
+def read_variable(nc, varname, copy=True, window=None):
+    '''
+    reads a variable in a netcdf file, missing values are replaced by nan.
+    the variable is copied once from the file in native byte order.
+    if copy is False and there are no missing values, returns a view on the file.
+    window is a tuple of slices (time, altitude) : only that part of the variable is copied.
+    '''
+    
+    netcdfvar = nc.variables[varname]
+    data = netcdfvar.data
+    if window is not None:
+        data = data[window[:data.ndim]]
+    missing = hasattr(netcdfvar, 'missing_value')
+    if not copy and not missing:
+        return data
+        
+    dtype = data.dtype.newbyteorder('=')
+    if missing:
+        dtype = np.result_type(dtype, np.float32)
+    variable = data.astype(dtype)
+
+    if missing:
+        idx = (variable==netcdfvar.missing_value)
+        variable[idx] = np.nan
+
+    return variable
+    
+    
+def netcdf_read_date(nc):
+    
+    if hasattr(nc, 'year'):
+        y = int(nc.year)
+        m = int(nc.month)
+        d = int(nc.day)
+    else:
+        print 'This netcdf file has not global attribute year'
+        print 'setting default date as 2006, 1, 1'
+        y, m, d = 2006,1,1
+
+    # bug in ALS data
+    if d > 1900:
+        y, d = d, y
+        
+    return datetime(y, m, d)
+    
+    
+def _hours_to_datetimes(date, time):
+    '''
+    converts a vector of decimal hours in a given day to datetime64,
+    truncated to the second
+    '''
+    
+    hour = np.floor(time)
+    hourfraction = time - hour
+    minutes = np.floor(hourfraction * 60.)
+    seconds = hourfraction * 3600 - minutes * 60.
+
+    seconds = (hour.astype('i8') * 60 + minutes.astype('i8')) * 60 + seconds.astype('i8')
+    return np.datetime64(date, 's') + seconds.astype('timedelta64[s]')
+    
+    
+def netcdf_read_time(nc):
+    
+    horizontal_varname = find_horizontal_variable(nc)
+    print 'Found horizontal variable : ', horizontal_varname
+    
+    time = nc.variables[horizontal_varname][:]
+    date = netcdf_read_date(nc)
+    time = _hours_to_datetimes(date, time)
+
+    return date, time
+    
+    
+def netcdf_read_altitude(nc):
+    
+    vertical_varname = find_vertical_variable(nc)
+    print 'Found vertical variable : ', vertical_varname
+    if vertical_varname is None:
+        # we have a problem
+        return None
+        
+    alt = nc.variables[vertical_varname][:]
+    if np.max(alt) > 1000:
+        alt = alt / 1000.
+    
+    return alt
+    
+    
+def netcdf_read_window(nc, time_range=None, alt_range=None):
+    '''
+    reads date, time and altitude of a netcdf file, for the profiles in time_range (start, end)
+    and the altitudes in alt_range (min, max) in km.
+    returns date, time, alt and the window (time slice, altitude slice) of data variables
+    '''
+    
+    date, time = netcdf_read_time(nc)
+    alt = netcdf_read_altitude(nc)
+    
+    window = (window_slice(time, time_range), slice(None))
+    if alt is not None:
+        window = (window[0], window_slice(alt, alt_range))
+        alt = alt[window[1]]
+        
+    return date, time[window[0]], alt, window
+    
+    
+def netcdf_read_data(nc, format, window=None):
+    
+    lidar_data = {}
+    variables = resolve_variables(nc, format)
+    for variable in variables:
+        lidar_data[variable] = read_variable(nc, variables[variable], window=window)
+        
+    return lidar_data
+    
+    
+def lidar_netcdf_file_read(source, format, time_range=None, alt_range=None):
+    '''
+    reads a netcdf file, only the profiles in time_range and the altitudes in alt_range.
+    returns None if there is no profile in time_range.
+    '''
+    
+    nc = netcdf_file(source)
+    
+    date, time, alt, window = netcdf_read_window(nc, time_range, alt_range)
+    if len(time) == 0:
+        nc.close()
+        return None
+    lidar_data = netcdf_read_data(nc, format, window)
+        
+    nc.close()
+    
+    data = {'time':time, 'alt':alt, 'data':lidar_data, 'date':date, 'filetype':'netcdf', 'instrument':format}
+    
+    return data
+    
+
+def lidar_netcdf_file_open(source, format, time_range=None, alt_range=None):
+    '''
+    opens a netcdf file without reading its data.
+    same output as lidar_netcdf_file_read, except the data dictionary
+    reads variables from the memory-mapped file only when they are accessed
+    '''
+    
+    nc = netcdf_file(source, mmap=True)
+    
+    date, time, alt, window = netcdf_read_window(nc, time_range, alt_range)
+    if len(time) == 0:
+        nc.close()
+        return None
+    variables = resolve_variables(nc, format)
+    loaders = dict((variable, partial(read_variable, nc, variables[variable], copy=False, window=window)) for variable in variables)
+    
+    data = {'time':time, 'alt':alt, 'data':LazyData(loaders), 'date':date, 'filetype':'netcdf', 'instrument':format}
+    
+    return data
+    
+
+def lidar_netcdf_file_index(source, format):
+    '''
+    describes a netcdf file from its dimensions and time variable, without reading its data
+    '''
+    
+    nc = netcdf_file(source)
+    
+    hours = nc.variables[find_horizontal_variable(nc)]
+    nprof = hours.shape[0]
+    if nprof > 0:
+        start, end = _hours_to_datetimes(netcdf_read_date(nc), np.array([hours[0], hours[-1]]))
+    else:
+        start, end = None, None
+    
+    alt = netcdf_read_altitude(nc)
+    if alt is None:
+        alt = []
+
+    channels = sorted(resolve_variables(nc, format))
+    
+    nc.close()
+
+    return file_index_entry(start, end, nprof, channels, alt)
+
+
+register_reader(DataReader(netcdf_formats, PrefixMatcher(((format, format) for format in netcdf_formats), '.nc'), '{format}*.nc',
+                           lidar_netcdf_file_read, lidar_netcdf_file_open, lidar_netcdf_file_index,
+                           lazy=True, windowed=True, parallel_safe=True))
+
+
+class test(unittest.TestCase):
+    
+    def _write(self, path, ntime):
+        nc = netcdf_file(path, 'w')
+        nc.year, nc.month, nc.day = 2011, 7, 5
+        nc.createDimension('time', ntime)
+        nc.createDimension('range', 4)
+        nc.createVariable('time', 'f8', ('time',))[:] = 6 + np.arange(ntime) / 120.
+        nc.createVariable('range', 'f4', ('range',))[:] = np.arange(4) * 15.
+        pr2 = nc.createVariable('pr2_0', 'f4', ('time', 'range'))
+        pr2.long_name = 'Apparent (not normalized) range-corrected back-scattered power (P*R*R)'
+        pr2.polarization, pr2.wavelength, pr2.Detection_mode = 'NULL', '355', 'analog'
+        pr2[:] = np.ones([ntime, 4])
+        nc.close()
+        
+    def test_resolve_lengths(self):
+        import shutil, tempfile
+        folder = tempfile.mkdtemp()
+        try:
+            resolved = []
+            for ntime in (5, 7):
+                path = os.path.join(folder, 'als450_%d.nc' % ntime)
+                self._write(path, ntime)
+                nc = netcdf_file(path)
+                resolved.append(resolve_variables(nc, 'als450'))
+                nc.close()
+            self.assertEqual(resolved[0], resolved[1])
+            self.assertEqual(len([key for key in _resolved_variables if key[0] == 'als450']), 1)
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,629 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+lna_bin.py
+
+Created by Vincent Noel on 2011-08-17.
+Copyright (c) 2011 LMD/CNRS. All rights reserved.
+"""
+
+import os
+import glob
+import unittest
+from functools import partial
+from util import lidar_data_merge, LazyData, datetime64_from_fields, window_slice
+from fileindex import file_index_entry
+from formats import PrefixMatcher, DataReader, register_reader
+import numpy as np
+
+
+def _improve_channel_name(name, start, fov_type):
+
+    if name.startswith('532') or name.startswith('1,06'):
+        newname = 'Pr2 '
+        if name.startswith('532'):
+            newname = newname + '532nm '
+        elif name.startswith('1,06'):
+            newname = 'p%02d - ' % (start + 1) + newname + '1064nm '
+            
+        if 'paral' in name:
+            newname = 'p%02d - ' % (start) + newname
+        elif 'perp' in name:
+            newname = 'p%02d - ' % (start + 2) + newname + 'crosspol '
+        newname = newname + fov_type
+    else:
+        newname = None
+
+    return newname
+    
+    
+def _improve_channel_names(names, fov_type):
+    """
+    create long versions of channel names   
+    """
+    
+    start = 1 if fov_type.startswith('NF') else 4
+    newnames = []
+    for name in names:
+        newname = _improve_channel_name(name, start, fov_type)
+        newnames.append(newname)
+    return newnames
+        
+
+def lna_binary_file_read(lnafile, format=None, time_range=None, alt_range=None):
+    """
+    read lna data from a file in binary format
+    fix names of datasets
+    correct several issues in data
+    only profiles in time_range (start, end) and gates in alt_range (min, max) in km are read,
+    returns None if there is no profile in time_range.
+    """
+    
+    lnafile, time_slice, range_slice = _lna_binary_file_window(lnafile, time_range, alt_range)
+    time = lnafile.times(time_slice)
+    if len(time) == 0:
+        return None
+
+    # correct for noise and square distance, high altitudes are never computed
+    data = {}
+    for name in lnafile.channels:
+        data[name] = lnafile.channel(name, time_slice, range_slice)
+
+    lna_data = {'time':time, 'alt':lnafile.alt[range_slice], 'data':data, 'date':time[0].tolist(), 'filetype':'binary'}
+        
+    return lna_data
+
+
+def lna_binary_file_open(lnafile, format=None, time_range=None, alt_range=None):
+    """
+    open lna data from a file in binary format without reading it.
+    same output as lna_binary_file_read, except the data dictionary
+    decodes and corrects channels only when they are accessed
+    """
+
+    lnafile, time_slice, range_slice = _lna_binary_file_window(lnafile, time_range, alt_range)
+    time = lnafile.times(time_slice)
+    if len(time) == 0:
+        return None
+        
+    loaders = dict((name, partial(lnafile.channel, name, time_slice, range_slice)) for name in lnafile.channels)
+
+    lna_data = {'time':time, 'alt':lnafile.alt[range_slice], 'data':LazyData(loaders), 'date':time[0].tolist(), 'filetype':'binary'}
+
+    return lna_data
+
+
+def _lna_binary_file_window(lnafile, time_range, alt_range):
+    """
+    opens a lna binary file, and finds the profiles in time_range and the gates in alt_range.
+    gates above 15 km are cut off, unless alt_range has a maximum altitude.
+    """
+    
+    if alt_range is None or alt_range[1] is None:
+        lnafile = LnaBinaryFile(lnafile)
+    else:
+        lnafile = LnaBinaryFile(lnafile, max_alt=np.inf)
+    time_slice, range_slice = lnafile.window(time_range, alt_range)
+    
+    return lnafile, time_slice, range_slice
+
+
+def lna_binary_file_index(lnafile, format=None):
+    """
+    describes a file in lna binary format from its header, first and last profiles
+    """
+
+    lnafile = LnaBinaryFile(lnafile)
+    if lnafile.nprof > 0:
+        start, end = _records_time(lnafile.records[[1, -1]])
+    else:
+        start, end = None, None
+
+    return file_index_entry(start, end, lnafile.nprof, sorted(lnafile.channels), lnafile.alt)
+
+
+class LnaBinaryFile(object):
+    """
+    SIRTA LNA binary file, memory-mapped after reading its header.
+    raw channel data is available as views on the file,
+    corrected channels are only computed for the requested profiles and gates.
+    """
+
+    def __init__(self, lnafile, max_alt=15.):
+
+        f = open(lnafile, 'rb')
+        self.header = _lna_header_read(f)
+        offset = f.tell()
+        f.seek(0, 2)
+        size = f.tell()
+        f.close()
+
+        self.filename = lnafile
+        self.npoints = self.header['npoints']
+        self.fov_type = 'WFOV' if (self.header['systeme']==1) else 'NFOV'
+        self.record_dtype = _lna_record_dtype(self.npoints)
+
+        # the first record is noise data
+        nrecords = min(self.header['nprof'], (size - offset) // self.record_dtype.itemsize)
+        self.records = np.memmap(lnafile, dtype=self.record_dtype, mode='r', offset=offset, shape=(nrecords,))
+
+        # altitude range in m, and converted to km
+        r = np.r_[0:np.max(self.npoints)] * self.header['resospace']
+        self.ngates = np.sum(r / 1e3 < max_alt)
+        self.r = r[:self.ngates]
+        self.alt = self.r / 1e3
+
+        # channels with long names, by index in file
+        self.channels = dict()
+        names = _improve_channel_names(self.header['intitules'], self.fov_type)
+        for j, name in enumerate(names):
+            if name is not None and self.npoints[j] > 1:
+                self.channels[name] = j
+
+    @property
+    def nprof(self):
+        return self.records.shape[0] - 1
+
+    @property
+    def time(self):
+        return _records_time(self.records[1:])
+
+    def times(self, time_slice=slice(None)):
+        """
+        times of the requested profiles, only their time fields are read
+        """
+        
+        return _records_time(self.records[1:][time_slice])
+
+    def window(self, time_range=None, alt_range=None):
+        """
+        slices of the profiles between time_range[0] and time_range[1]
+        and of the gates between alt_range[0] and alt_range[1] (km), None for no limit.
+        profiles are found by bisection, only the time fields of a few records are read.
+        """
+        
+        time_slice = slice(None)
+        if time_range is not None:
+            records = self.records[1:]
+            start, end = time_range
+            i0 = 0 if start is None else _records_search(records, np.datetime64(start, 's'))
+            i1 = len(records) if end is None else _records_search(records, np.datetime64(end, 's'), side='right')
+            time_slice = slice(i0, max(i0, i1))
+            
+        return time_slice, window_slice(self.alt, alt_range)
+
+    def raw(self, name):
+        """
+        raw signal of a channel (nprof * npoints), as a view on the file
+        """
+
+        return self.records['ch%d' % self.channels[name]][1:]
+
+    def channel(self, name, time_slice=slice(None), range_slice=slice(None)):
+        """
+        signal of a channel, corrected for noise and square distance,
+        for the requested profiles and gates only
+        """
+
+        j = self.channels[name]
+        records = self.records['ch%d' % j]
+        gates = slice(*range_slice.indices(min(self.ngates, self.npoints[j])))
+
+        noise = _remove_bias(records[0])[gates]
+        return _noise_range_correct(records[1:][time_slice], noise, self.r[gates], gates)
+
+
+class LnaBinaryTail(object):
+    """
+    profiles appended to a lna binary file while it is written.
+    the byte offset of the next profile record is kept : read() decodes only
+    the complete records written since the previous read, using the record size
+    given by the file header. profiles until after (datetime64) are skipped.
+    """
+
+    def __init__(self, lnafile, alt_range=None, after=None):
+
+        f = open(lnafile, 'rb')
+        header = _lna_header_read(f)
+        self.data_offset = f.tell()
+        f.close()
+        if len(header['reserve']) < 128:
+            raise ValueError('incomplete header in ' + lnafile)
+        
+        self.filename = lnafile
+        self.nprof_max = header['nprof']
+        self.record_dtype = _lna_record_dtype(header['npoints'])
+        self.alt_range = alt_range
+        self.noise = None
+        # number of records read, including the noise record, and time of the last one
+        self.nrecords = 0
+        self.last_time = None
+        if after is not None:
+            # first profile after, found by bisection
+            records = LnaBinaryFile(lnafile).records[1:]
+            nprof = _records_search(records, np.datetime64(after, 's'), side='right')
+            self.nrecords = 1 + nprof
+            if nprof > 0:
+                self.last_time = _records_time(records[nprof-1:nprof])[0]
+            
+    def _nrecords(self):
+        
+        return min(self.nprof_max, (os.path.getsize(self.filename) - self.data_offset) // self.record_dtype.itemsize)
+
+    @property
+    def offset(self):
+        return self.data_offset + self.nrecords * self.record_dtype.itemsize
+
+    def read(self):
+        """
+        lna data of the new profiles (see lna_binary_file_read), None if there is none
+        """
+
+        nrecords = self._nrecords()
+        if nrecords <= max(self.nrecords, 1):
+            return None
+            
+        if self.noise is None:
+            # noise, altitudes and channels from the first record, once
+            lnafile, time_slice, range_slice = _lna_binary_file_window(self.filename, None, self.alt_range)
+            self.alt = lnafile.alt[range_slice]
+            self.r = lnafile.r
+            self.noise = dict()
+            for name, j in lnafile.channels.items():
+                gates = slice(*range_slice.indices(min(lnafile.ngates, lnafile.npoints[j])))
+                self.noise[name] = (j, gates, _remove_bias(lnafile.records['ch%d' % j][0])[gates])
+            self.nrecords = max(self.nrecords, 1)
+            
+        f = open(self.filename, 'rb')
+        f.seek(self.offset)
+        records = np.fromfile(file=f, dtype=self.record_dtype, count=nrecords - self.nrecords)
+        f.close()
+        self.nrecords += len(records)
+        
+        data = {}
+        for name, (j, gates, noise) in self.noise.items():
+            data[name] = _noise_range_correct(records['ch%d' % j], noise, self.r[gates], gates)
+        time = _records_time(records)
+        self.last_time = time[-1]
+        
+        return {'time':time, 'alt':self.alt, 'data':data, 'date':time[0].tolist(), 'filetype':'binary'}
+        
+        
+class LnaBinaryFollower(object):
+    """
+    follows a folder of lna binary files while they are written.
+    each read() returns the profiles appended to its files, or in new files, since the previous read.
+    profiles until after (datetime64), e.g. already read, are skipped in files already in the folder.
+    narrow and wide field of view files are written at the same time : profiles are only returned
+    up to the last profile written in both, later ones wait for the next read.
+    """
+
+    def __init__(self, lnafolder, alt_range=None, after=None):
+
+        self.lnafolder = lnafolder
+        self.alt_range = alt_range
+        self.tails = dict()
+        # profiles read, not returned yet
+        self.pending = []
+        if after is not None:
+            for lnafile in self._files():
+                try:
+                    self.tails[lnafile] = LnaBinaryTail(lnafile, alt_range, after)
+                except (ValueError, IndexError):
+                    # header not completely written yet : the file is read from its first profile by read()
+                    continue
+
+    def _files(self):
+        
+        return glob.glob(self.lnafolder + '/lna_0a_raw[NW]F_*.dat')
+
+    def read(self):
+        """
+        lna data of the new profiles of the folder (see lna_binary_file_read), None if there is none
+        """
+
+        files = sorted(self._files(), key=_lna_binary_file_sort_key)
+        for lnafile in files:
+            if lnafile not in self.tails:
+                try:
+                    self.tails[lnafile] = LnaBinaryTail(lnafile, self.alt_range)
+                except (ValueError, IndexError):
+                    # header not completely written yet
+                    continue
+            data = self.tails[lnafile].read()
+            if data is not None:
+                self.pending.append(data)
+                
+        # last profile written in the last file of each field of view
+        last_times = []
+        for fov_type in ['NF', 'WF']:
+            fov_files = [lnafile for lnafile in files if os.path.basename(lnafile).startswith('lna_0a_raw' + fov_type)]
+            if fov_files and fov_files[-1] in self.tails and self.tails[fov_files[-1]].last_time is not None:
+                last_times.append(self.tails[fov_files[-1]].last_time)
+        if not self.pending or not last_times:
+            return None
+            
+        ready, pending = [], []
+        for data in self.pending:
+            done = data['time'] <= min(last_times)
+            if np.any(done):
+                ready.append(_lna_data_select(data, done))
+            if not np.all(done):
+                pending.append(_lna_data_select(data, ~done))
+        self.pending = pending
+        
+        if not ready:
+            return None
+        return lidar_data_merge(ready)
+        
+        
+def _lna_data_select(data, profiles):
+    """
+    lna data (see lna_binary_file_read) of the selected profiles only
+    """
+    
+    time = data['time'][profiles]
+    selected = dict((name, values[profiles]) for name, values in data['data'].items())
+    return {'time':time, 'alt':data['alt'], 'data':selected, 'date':time[0].tolist(), 'filetype':data['filetype']}
+
+
+def _noise_range_correct(raw, noise, r, gates):
+    """
+    signal minus bias and noise, range-corrected and scaled by 1e-12.
+    raw is the int16 signal (nprof * npoints), only the requested gates are computed.
+    everything is done in place in a single float32 array, without temporary
+    arrays per profile.
+    """
+
+    # bias is the average of the last 200 points of each profile
+    bias = np.mean(raw[:, -200:], axis=-1).astype('f4')
+    r2 = (r * r * 1e-12).astype('f4')
+
+    pmbr2 = np.empty([raw.shape[0], len(r2)], dtype='f4')
+    # -(raw - bias) - noise
+    np.subtract(bias[:, np.newaxis], raw[:, gates], out=pmbr2)
+    pmbr2 -= noise.astype('f4')
+    pmbr2 *= r2
+
+    return pmbr2
+
+
+def _lna_header_read(f):
+    """
+    reads the ASCII and binary headers of a SIRTA LNA binary file.
+    leaves the file positioned at the first profile record.
+    returns a dictionary of header fields
+    variable names follow sirta conventions
+    """
+
+    # ASCII header
+    # read the first line, split it in fields
+    line = f.readline()
+    words = line.split()
+    nlines_header = int(words[0][1:])
+    # skip the rest of the header
+    for i in range(1,nlines_header):
+        line = f.readline()
+
+    # binary header
+    header = {}
+    header['nprof'], header['systeme'], header['freq'] = np.fromfile(file=f, dtype='<i4', count=3)
+    header['resotemp'], header['resospace'] = np.fromfile(file=f, dtype='<f4', count=2)
+    header['pretrig'], header['moy'], header['moybruit'], nvoies = np.fromfile(file=f, dtype='<i4', count=4)
+    header['nvoies'] = nvoies
+    header['intitules'] = np.fromfile(file=f, dtype='<S10', count=nvoies)
+    header['npoints'] = np.fromfile(file=f, dtype='<i4', count=nvoies)
+    header['codages'] = np.fromfile(file=f, dtype='<i4', count=nvoies)
+    header['gains'] = np.fromfile(file=f, dtype='<f4', count=nvoies)
+    header['offsets'] = np.fromfile(file=f, dtype='<f4', count=nvoies)
+    header['gains_externes'] = np.fromfile(file=f, dtype='<f4', count=nvoies)
+    header['offsets_externes'] = np.fromfile(file=f, dtype='<f4', count=nvoies)
+    header['reserve'] = np.fromfile(file=f, dtype='i1', count=128)
+
+    return header
+
+
+def _lna_record_dtype(npoints):
+    """
+    numpy dtype of one profile record : 6 time fields (d, m, y, hh, mm, ss)
+    followed by npoints[j] samples for each channel j.
+    channels without points have no field.
+    """
+
+    fields = [('date', '<u2', 6)]
+    for j, n in enumerate(npoints):
+        if n > 0:
+            fields.append(('ch%d' % j, '<i2', n))
+    return np.dtype(fields)
+
+
+def _remove_bias(data):
+    """
+    remove the average bias of the last 200 points from each profile (last axis)
+    and flip the signal sign
+    """
+
+    bias = np.mean(data[..., -200:], axis=-1)
+    return -(data - bias[..., np.newaxis])
+
+
+def _records_time(records):
+    """
+    datetime64 vector from the time fields of profile records
+    """
+
+    d, m, y, hh, mm, ss = records['date'].astype('i8').T
+    return datetime64_from_fields(y, m, d, (hh * 60 + mm) * 60 + ss)
+
+
+def _records_search(records, t, side='left'):
+    """
+    index where t (datetime64) would be inserted in records sorted in time,
+    before (left) or after (right) records at time t.
+    """
+
+    lo, hi = 0, len(records)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        tmid = _records_time(records[mid:mid+1])[0]
+        if tmid < t or (side == 'right' and tmid == t):
+            lo = mid + 1
+        else:
+            hi = mid
+    
+    return lo
+
+
+def lna_bin_read(lnafile, debug=False, time_range=None):
+    """
+    Reads all the data from a SIRTA LNA binary file.
+    parameters:
+        lnafile - name of the LNA data file
+        debug - if True, prints out information during read
+        time_range - (start, end), only profiles in that range are read (None for no limit)
+    output:
+        time - vector of datetime64 (nprof)
+        r - vector of vertical altitude range (npoints)
+        p - arrays of lidar power (integer, arbitrary units) (nprof * npoints)
+            arranged as a list by channel number
+            e.g. p[5][:,:] is the lidar power array of channel #5
+            this is because channels don't necessarily have the same number of points
+        b - list of vectors of profile noise level (nprof)
+            e.g. b[5][:] is the profile noise vector of channel 5
+        intitules - list of names for channels (nchannels)
+        fov_type - either WF or NF
+    """
+    
+    f = open(lnafile, 'rb')
+    header = _lna_header_read(f)
+    
+    nvoies = header['nvoies']
+    npoints = header['npoints']
+    intitules = header['intitules']
+    fov_type = 'WFOV' if (header['systeme']==1) else 'NFOV'
+
+    # all profile records are read in one go
+    # the first profile is noise data
+    record_dtype = _lna_record_dtype(npoints)
+    if time_range is None:
+        records = np.fromfile(file=f, dtype=record_dtype, count=header['nprof'])
+    else:
+        # seek past the profiles before time_range, stop after it
+        time_slice = LnaBinaryFile(lnafile).window(time_range)[0]
+        offset = f.tell()
+        noise = np.fromfile(file=f, dtype=record_dtype, count=1)
+        f.seek(offset + (time_slice.start + 1) * record_dtype.itemsize)
+        records = np.fromfile(file=f, dtype=record_dtype, count=time_slice.stop - time_slice.start)
+        records = np.concatenate([noise, records])
+    f.close()
+    nprof = records.shape[0] - 1
+
+    if debug:
+        print 'n voies: ', nvoies
+        print 'n profiles : ', nprof
+        print 'intitules voies : ', intitules
+        print 'npoints : ', npoints
+
+    # altitude range
+    maxpoints = np.max(npoints)
+    r = np.r_[0:maxpoints] * header['resospace']
+
+    # noise data, time fields unused
+    b = []
+    p = []
+    for j, n in enumerate(npoints):
+        if n > 0:
+            b.append(_remove_bias(records['ch%d' % j][0]))
+            # store profile data corrected for average bias
+            p.append(_remove_bias(records['ch%d' % j][1:]))
+        else:
+            b.append(np.empty(0))
+            p.append(np.empty([nprof, 0]))
+
+    time = _records_time(records[1:])
+             
+    return time, r, p, b, intitules, fov_type
+                
+
+def _lna_binary_file_sort_key(lnafile):
+    # what follows lna_0a_rawNF, so NF and WF files are interleaved
+    return os.path.basename(lnafile)[12:]
+
+
+register_reader(DataReader(['lnabinary'], PrefixMatcher({'lna_0a_raw':'lnabinary'}, '.dat'), 'lna_0a_raw[NW]F_*.dat',
+                           lna_binary_file_read, lna_binary_file_open, lna_binary_file_index,
+                           file_sort_key=_lna_binary_file_sort_key, lazy=True, windowed=True, parallel_safe=True))
+
+
+class test(unittest.TestCase):
+    
+    def test_file(self):
+        testfile = 'test_data/binary/lna_0a_rawNF_v01_20110705_065026_31.dat'
+        lna_data = lna_binary_file_read(testfile)
+        time = lna_data['time']
+        self.assertEqual(len(time), 180)
+        
+    def test_folder(self):
+        from lidardata import LidarData
+        lidardata = LidarData('test_data/binary', cache=False)
+        # NF and WF profiles share the same times
+        self.assertEqual(len(lidardata.datetime), 1440)
+        
+    def test_follow(self):
+        from lidardata import LidarData
+        import shutil, tempfile
+        # first narrow and wide field of view files, written while followed : wide field of view lags
+        files = [sorted(glob.glob('test_data/binary/lna_0a_raw%s_*.dat' % fov_type), key=_lna_binary_file_sort_key)[0] 
+                 for fov_type in ('NF', 'WF')]
+        folder = tempfile.mkdtemp()
+        
+        def write(nprofs):
+            for lnafile, nprof in zip(files, nprofs):
+                lnabinary = LnaBinaryFile(lnafile)
+                size = lnabinary.records.offset + (nprof + 1) * lnabinary.record_dtype.itemsize
+                open(os.path.join(folder, os.path.basename(lnafile)), 'wb').write(open(lnafile, 'rb').read()[:size])
+                
+        try:
+            write([100, 60])
+            lidardata = LidarData(folder, cache=False)
+            # files are written before following starts
+            write([120, 90])
+            follower = LnaBinaryFollower(folder, after=lidardata.last_time())
+            for nprofs in ([150, 120], [180, 180]):
+                write(nprofs)
+                lidardata.extend(follower.read())
+            expected = LidarData(folder, cache=False)
+            np.testing.assert_array_equal(lidardata.datetime, expected.datetime)
+            self.assertEqual(sorted(lidardata.data.keys()), sorted(expected.data.keys()))
+            for name in expected.data.keys():
+                np.testing.assert_array_equal(lidardata.data[name], expected.data[name])
+        finally:
+            shutil.rmtree(folder)
+            
+    def test_follow_partial_header(self):
+        import shutil, tempfile
+        lnafile = sorted(glob.glob('test_data/binary/lna_0a_rawNF_*.dat'), key=_lna_binary_file_sort_key)[0]
+        folder = tempfile.mkdtemp()
+        try:
+            # a file just created, its header being written
+            content = open(lnafile, 'rb').read()
+            newfile = os.path.join(folder, os.path.basename(lnafile))
+            open(newfile, 'wb').write(content[:30])
+            follower = LnaBinaryFollower(folder, after=np.datetime64('2011-07-05T00:00:00'))
+            self.assertEqual(follower.read(), None)
+            open(newfile, 'wb').write(content)
+            self.assertEqual(len(follower.read()['time']), 180)
+        finally:
+            shutil.rmtree(folder)
+    
+
+if __name__ == '__main__':    
+    print 'profiling now'
+    import cProfile
+    from lidardata import LidarData
+    cProfile.run("LidarData('test_data/binary', cache=False)", 'profile')
+
+    unittest.main()
+    
+    # profiling
+    
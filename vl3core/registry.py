@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+registry.py
+
+Datasets opened in this process, shared between the windows showing them.
+A dataset is identified by its source and read options, and counts the windows
+using it : opening it again returns the same LidarData, whose data arrays
+are read-only, and it is forgotten when the last window releases it.
+
+    lidardata = dataset_open('/bdd/SIRTA/...')
+    ...
+    dataset_release(lidardata)
+"""
+
+import os
+
+from lidardata import LidarData
+
+
+# key -> [lidardata, number of users]
+_datasets = dict()
+
+
+def _dataset_key(source, time_range=None, alt_range=None):
+
+    if not isinstance(source, tuple):
+        source = os.path.abspath(source)
+    return repr((source, time_range, alt_range))
+
+
+def _find(lidardata):
+
+    for key, entry in _datasets.items():
+        if entry[0] is lidardata:
+            return key
+    return None
+
+
+def dataset_opened(source, time_range=None, alt_range=None):
+    """
+    True if the dataset of source read in time_range and alt_range is already open
+    """
+
+    return _dataset_key(source, time_range, alt_range) in _datasets
+
+
+def dataset_open(source, time_range=None, alt_range=None):
+    """
+    LidarData of source read in time_range and alt_range (see LidarData),
+    read only if it is not open already. Raises InvalidFormat like LidarData.
+    """
+
+    key = _dataset_key(source, time_range, alt_range)
+    if key in _datasets:
+        _datasets[key][1] += 1
+        return _datasets[key][0]
+
+    lidardata = LidarData(from_source=source, time_range=time_range, alt_range=alt_range, cache=True)
+    lidardata.set_read_only()
+    _datasets[key] = [lidardata, 1]
+    return lidardata
+
+
+def dataset_register(lidardata, time_range=None, alt_range=None):
+    """
+    shares a dataset read otherwise (e.g. in a background thread)
+    as the dataset of its source. nothing is done if that dataset is open already.
+    """
+
+    key = _dataset_key(lidardata.data_source, time_range, alt_range)
+    if key in _datasets:
+        return
+    lidardata.set_read_only()
+    _datasets[key] = [lidardata, 1]
+
+
+def dataset_shared(lidardata):
+    """
+    True if lidardata is an open dataset, shared between windows
+    """
+    
+    return _find(lidardata) is not None
+    
+    
+def dataset_acquire(lidardata):
+    """
+    one more user of an open dataset
+    """
+
+    key = _find(lidardata)
+    if key is not None:
+        _datasets[key][1] += 1
+    return lidardata
+
+
+def dataset_release(lidardata):
+    """
+    one user less of an open dataset, forgotten when it has no user left
+    """
+
+    key = _find(lidardata)
+    if key is None:
+        return
+    _datasets[key][1] -= 1
+    if _datasets[key][1] <= 0:
+        del _datasets[key]
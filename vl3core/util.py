@@ -0,0 +1,492 @@
+"""
+util.py
+
+VNoel 2011-10-20
+
+contains utility functions used in other places
+
+"""
+
+import sys
+import unittest
+import warnings
+import numpy as np
+from collections import OrderedDict
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from threading import Thread, Lock
+from config import read_workers
+
+def signal_ratio(denum, num, ratio_min=0, ratio_max=10, invalid=-998):
+
+    d = num / denum
+
+    idx = (denum < invalid) | (num < invalid) | (d < ratio_min) | (d > ratio_max)
+    d[idx] = np.nan
+
+    return d
+
+
+def datetime64_from_fields(year, month, day, seconds):
+    """
+    vectorized conversion of arrays of year, month, day and seconds in the day
+    to a datetime64 array, with a resolution of one second
+    """
+
+    days = (np.asarray(year, dtype='i8') - 1970).astype('datetime64[Y]').astype('datetime64[M]')
+    days = days + (np.asarray(month, dtype='i8') - 1).astype('timedelta64[M]')
+    days = days.astype('datetime64[D]') + (np.asarray(day, dtype='i8') - 1).astype('timedelta64[D]')
+    return days.astype('datetime64[s]') + np.asarray(seconds, dtype='i8').astype('timedelta64[s]')
+
+
+def datetime64_to_epoch(time):
+    """
+    converts datetime64 values to seconds since 1970-01-01 (as used by chaco)
+    """
+
+    return (time - np.datetime64('1970-01-01T00:00:00')) / np.timedelta64(1, 's')
+
+
+def epoch_to_datetime64(seconds):
+    """
+    converts seconds since 1970-01-01 to datetime64, truncated to the second
+    """
+
+    return np.datetime64('1970-01-01T00:00:00') + np.asarray(seconds, dtype='i8').astype('timedelta64[s]')
+
+
+def window_slice(values, value_range):
+    """
+    slice of a sorted vector (increasing or decreasing) with the values
+    between value_range[0] and value_range[1] included (None for no limit).
+    datetime64 vectors can be sliced with datetime or datetime64 limits.
+    """
+
+    if value_range is None:
+        return slice(None)
+
+    lo, hi = value_range
+    if values.dtype.kind == 'M':
+        lo = None if lo is None else np.datetime64(lo, 's')
+        hi = None if hi is None else np.datetime64(hi, 's')
+
+    n = len(values)
+    if n > 1 and values[0] > values[-1]:
+        reverse = values[::-1]
+        i0 = 0 if hi is None else n - np.searchsorted(reverse, hi, side='right')
+        i1 = n if lo is None else n - np.searchsorted(reverse, lo, side='left')
+    else:
+        i0 = 0 if lo is None else np.searchsorted(values, lo, side='left')
+        i1 = n if hi is None else np.searchsorted(values, hi, side='right')
+
+    return slice(int(i0), int(i1))
+
+
+def bin_centers(values, nvalues):
+    """
+    mean of groups of nvalues consecutive values (the last group can be smaller)
+    """
+
+    starts = np.arange(0, len(values), nvalues)
+    sizes = np.diff(np.append(starts, len(values)))
+    return np.add.reduceat(np.asarray(values, dtype=float), starts) / sizes
+
+
+def bin_profiles(data, nprofs, ngates, statistic='mean'):
+    """
+    data (profiles * gates) aggregated in bins of nprofs profiles * ngates gates
+    (bins at the end of each axis can be smaller), with the 'mean', 'median', 'count' or 'sum'
+    of the valid (not nan) values of each bin. mean and median are nan for bins without valid values.
+    """
+
+    nprof, ngate = data.shape
+
+    if statistic == 'median':
+        nbins_prof, nbins_gate = -(-nprof // nprofs), -(-ngate // ngates)
+        if nprof == 0:
+            # e.g. bins after the last one
+            return np.empty([0, nbins_gate], dtype=np.float32)
+        padded = np.full([nbins_prof * nprofs, nbins_gate * ngates], np.nan, dtype=np.float32)
+        padded[:nprof, :ngate] = data
+        blocks = padded.reshape(nbins_prof, nprofs, nbins_gate, ngates).swapaxes(1, 2)
+        with warnings.catch_warnings():
+            # bins without valid values
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return np.nanmedian(blocks.reshape(nbins_prof, nbins_gate, -1), axis=2)
+
+    prof_starts = np.arange(0, nprof, nprofs)
+    gate_starts = np.arange(0, ngate, ngates)
+    valid = np.isfinite(data)
+    counts = np.add.reduceat(np.add.reduceat(valid, prof_starts, axis=0, dtype=np.int32), gate_starts, axis=1)
+    if statistic == 'count':
+        return counts
+
+    sums = np.add.reduceat(np.where(valid, data, 0), prof_starts, axis=0, dtype=float)
+    sums = np.add.reduceat(sums, gate_starts, axis=1)
+    if statistic == 'sum':
+        return sums.astype(np.float32)
+
+    with np.errstate(invalid='ignore'):
+        return (sums / counts).astype(np.float32)
+
+
+def buffer_append(buffer, size, values):
+    """
+    writes values (along the first axis) after the first size elements of buffer.
+    when buffer is too small, it is copied in a new buffer with room for as many elements again,
+    so that appending n elements costs O(n) on average.
+    returns the buffer (the same or a new one) and the number of elements written in it.
+    """
+
+    end = size + len(values)
+    if end > len(buffer):
+        grown = np.empty((2 * end,) + buffer.shape[1:], dtype=buffer.dtype)
+        grown[:size] = buffer[:size]
+        buffer = grown
+    buffer[size:end] = values
+
+    return buffer, end
+
+
+class LazyData(object):
+    """
+    dictionary-like container of data arrays, only computed when accessed.
+    loaders is a dictionary of functions returning the array for each key.
+    the last `keep` accessed arrays are kept in memory.
+    """
+
+    def __init__(self, loaders=None, keep=0):
+        self.loaders = dict() if loaders is None else dict(loaders)
+        self.keep = keep
+        self._cache = OrderedDict()
+
+    def __getitem__(self, key):
+        if key in self._cache:
+            value = self._cache.pop(key)
+        else:
+            value = self.loaders[key]()
+        if self.keep > 0:
+            self._cache[key] = value
+            while len(self._cache) > self.keep:
+                self._cache.popitem(last=False)
+        return value
+
+    def __setitem__(self, key, value):
+        self.loaders[key] = partial(_identity, value)
+        self._cache.pop(key, None)
+
+    def __delitem__(self, key):
+        del self.loaders[key]
+        self._cache.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self.loaders
+
+    def __iter__(self):
+        return iter(self.loaders)
+
+    def __len__(self):
+        return len(self.loaders)
+
+    def keys(self):
+        return self.loaders.keys()
+
+
+class LruCache(object):
+    """
+    dictionary-like container of values with a size in bytes, of at most max_size bytes.
+    the least recently used values are dropped first.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+        item = self._items.pop(key)
+        self._items[key] = item
+        return item[0]
+
+    def put(self, key, value, size):
+        if key in self._items:
+            self.size -= self._items.pop(key)[1]
+        if size > self.max_size:
+            return
+        self._items[key] = (value, size)
+        self.size += size
+        while self.size > self.max_size:
+            self.size -= self._items.popitem(last=False)[1][1]
+
+    def clear(self):
+        self._items.clear()
+        self.size = 0
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+def _identity(value):
+    return value
+
+
+def _apply(function, data, key):
+    return function(data[key])
+
+
+def lazy_apply(function, data, keep=0):
+    """
+    returns a LazyData containing function(data[key]) for every key in data,
+    computed on access. data can be a dictionary or a LazyData.
+    """
+
+    loaders = dict((key, partial(_apply, function, data, key)) for key in data)
+    return LazyData(loaders, keep=keep)
+
+
+def _merge_positions(timelist):
+    """
+    merge sorted time vectors into a single sorted vector without duplicates.
+    returns the merged time vector, and for each input vector the position of its profiles in it.
+    """
+
+    alltime = np.concatenate(timelist)
+    # a stable sort of concatenated sorted runs is a k-way merge
+    order = np.argsort(alltime, kind='mergesort')
+    sortedtime = alltime[order]
+
+    first = np.ones(len(sortedtime), dtype=bool)
+    first[1:] = sortedtime[1:] != sortedtime[:-1]
+    newtime = sortedtime[first]
+
+    positions = np.empty(len(alltime), dtype=int)
+    positions[order] = np.cumsum(first) - 1
+    bounds = np.cumsum([0] + [len(time) for time in timelist])
+    positions = [positions[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    return newtime, positions
+
+
+def _read_part(key, part):
+    data, position = part
+    return data[key], position
+
+
+def _merge_array(datalist, positions, ntime, key, workers=1, start=0, end=None):
+    """
+    puts the arrays datalist[i][key] at rows positions[i] of a single preallocated array.
+    profiles with the same time are taken from the first array that has them,
+    rows missing from all arrays are set to nan.
+    arrays of LazyData are read (decoded) by a pool of workers threads, see pool_map.
+    only rows start to end (default ntime) are built, from the arrays with profiles in them :
+    returns None if there is none.
+    """
+
+    end = ntime if end is None else end
+    inputs = [(data, position) for data, position in zip(datalist, positions) 
+              if key in data and len(position) > 0 and position.min() < end and position.max() >= start]
+    if not inputs:
+        return None
+    parts = pool_map(partial(_read_part, key), inputs, workers=workers)
+    dtype = np.result_type(np.float32, *[part.dtype for part, position in parts])
+    merged = np.empty((end - start,) + parts[0][0].shape[1:], dtype=dtype)
+    filled = np.zeros(end - start, dtype=bool)
+
+    # last arrays first, so that the first ones overwrite duplicate profiles
+    for part, position in reversed(parts):
+        if start > 0 or end < ntime:
+            inside = (position >= start) & (position < end)
+            part, position = part[inside], position[inside] - start
+        merged[position[::-1]] = part[::-1]
+        filled[position] = True
+    merged[~filled] = np.nan
+
+    return merged
+
+
+class MergedData(LazyData):
+    """
+    LazyData of the arrays of datasets merged on a single time vector (see lidar_data_merge).
+    rows() builds some rows of an array only, reading the datasets with profiles in them.
+    """
+
+    def __init__(self, datalist, positions, ntime, workers=1):
+        keys = set()
+        for data in datalist:
+            keys.update(data.keys())
+        LazyData.__init__(self, dict((key, partial(_merge_array, datalist, positions, ntime, key, workers=workers)) 
+                                     for key in keys))
+        self.datalist = datalist
+        self.positions = positions
+        self.ntime = ntime
+        self.workers = workers
+
+    def rows(self, key, start, end):
+        """
+        rows start to end of the merged array key, None if no dataset has profiles there
+        """
+
+        return _merge_array(self.datalist, self.positions, self.ntime, key, self.workers, start, end)
+
+    def starts(self, key):
+        """
+        first row of the profiles of each dataset with the array key, sorted
+        """
+
+        return sorted(position.min() for data, position in zip(self.datalist, self.positions) 
+                      if key in data and len(position) > 0)
+
+
+def lidar_data_merge(datalist, workers=1):
+    """
+    merge a list of datasets:
+    merge and sort time vectors from all datasets, removing duplicate profiles
+    merge data arrays from all datasets on the merged time vector,
+    with nan for profiles that are missing from a dataset
+    each data array is built once, in a preallocated array.
+    if any dataset has LazyData, merged arrays are built when accessed (see MergedData),
+    their parts are read by workers threads (see pool_map).
+    """
+
+    datalist = [lidar_data for lidar_data in datalist if lidar_data is not None]
+    if len(datalist) == 0:
+        return None
+    elif len(datalist) == 1:
+        return datalist[0].copy()
+
+    newtime, positions = _merge_positions([lidar_data['time'] for lidar_data in datalist])
+    datas = [lidar_data['data'] for lidar_data in datalist]
+    keys = set()
+    for data in datas:
+        keys.update(data.keys())
+
+    if any(isinstance(data, LazyData) for data in datas):
+        data = MergedData(datas, positions, len(newtime), workers)
+    else:
+        data = dict((key, _merge_array(datas, positions, len(newtime), key)) for key in keys)
+
+    lidar_data = datalist[0].copy()
+    lidar_data['time'] = newtime
+    lidar_data['data'] = data
+
+    return lidar_data
+
+
+def _thread_map(function, items, workers):
+    """
+    map function on items with workers threads taking the next item in turn.
+    threads are started for each call : unlike a multiprocessing ThreadPool,
+    there is no pool to shut down (which takes 0.1 s in python 2), and calls can be nested.
+    """
+
+    results = [None] * len(items)
+    errors = []
+    indices = iter(range(len(items)))
+    lock = Lock()
+
+    def work():
+        while not errors:
+            with lock:
+                i = next(indices, None)
+            if i is None:
+                return
+            try:
+                results[i] = function(items[i])
+            except Exception:
+                errors.append(sys.exc_info())
+
+    threads = [Thread(target=work) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+
+    return results
+
+
+def pool_map(function, items, workers=None, processes=False):
+    """
+    map function on items with a pool of workers, results are in the order of items.
+    runs serially if workers is 1 or there is only one item.
+    threads are used unless processes is True (function and results must then be picklable).
+    """
+
+    if workers is None:
+        workers = read_workers or cpu_count()
+    workers = min(workers, len(items))
+    if workers <= 1:
+        return map(function, items)
+    if not processes:
+        return _thread_map(function, items, workers)
+
+    pool = Pool(workers)
+    try:
+        results = pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def lidar_multiple_files_read(filelist, file_read_function, format, workers=None, processes=False):
+    """
+    reads a list of files in parallel and merges them on a single sorted time vector
+    (files do not need to be in time order, and can overlap).
+    workers is the number of files read at the same time (1 reads files one after another),
+    see pool_map. when file_read_function opens files without reading them (LazyData),
+    the data of the files is read by as many threads when it is accessed.
+    """
+
+    datalist = pool_map(partial(file_read_function, format=format), filelist, workers=workers, processes=processes)
+
+    return lidar_data_merge(datalist, workers=workers)
+
+
+
+class test(unittest.TestCase):
+
+    def setUp(self):
+        self.t0 = np.datetime64('2011-07-05T06:00:00')
+
+    def dataset(self, seconds, values, lazy=False):
+        data = {'a':np.array(values, dtype=np.float32)[:, np.newaxis]}
+        if lazy:
+            data = lazy_apply(_identity, data)
+        return {'time':self.t0 + np.array(seconds).astype('timedelta64[s]'), 'alt':np.zeros(1),
+                'data':data, 'date':None, 'filetype':'binary'}
+
+    def test_bin_empty(self):
+        for statistic in ('mean', 'median', 'count', 'sum'):
+            self.assertEqual(bin_profiles(np.zeros([0, 6], dtype=np.float32), 5, 2, statistic).shape, (0, 3))
+
+    def test_merge_positions(self):
+        newtime, positions = _merge_positions([np.array([0, 2, 4]), np.array([1, 2, 5]), np.array([4])])
+        np.testing.assert_array_equal(newtime, [0, 1, 2, 4, 5])
+        np.testing.assert_array_equal(positions[0], [0, 2, 3])
+        np.testing.assert_array_equal(positions[1], [1, 2, 4])
+        np.testing.assert_array_equal(positions[2], [3])
+
+    def test_merge_overlapping(self):
+        # files out of order, overlapping in time, the second without channel b
+        first = self.dataset([20, 30, 40], [2, 3, 4])
+        first['data']['b'] = np.array([[1.], [2.], [3.]], dtype=np.float32)
+        merged = lidar_data_merge([first, self.dataset([0, 10, 20], [0, 1, 9])])
+        np.testing.assert_array_equal(merged['time'] - self.t0, np.array([0, 10, 20, 30, 40]).astype('timedelta64[s]'))
+        np.testing.assert_array_equal(merged['data']['a'][:, 0], [0, 1, 2, 3, 4])
+        np.testing.assert_array_equal(merged['data']['b'][:, 0], [np.nan, np.nan, 1, 2, 3])
+
+    def test_merge_first_wins(self):
+        # duplicate profiles are taken from the first dataset that has them, also when read lazily
+        for lazy, workers in (False, 1), (True, 1), (True, 3):
+            datalist = [self.dataset([0, 10], [1, 2], lazy), self.dataset([10, 20], [5, 6], lazy),
+                        self.dataset([0, 20, 30], [7, 8, 9], lazy)]
+            merged = lidar_data_merge(datalist, workers=workers)
+            self.assertEqual(isinstance(merged['data'], LazyData), lazy)
+            np.testing.assert_array_equal(merged['data']['a'][:, 0], [1, 2, 6, 9])